@@ -0,0 +1,286 @@
+# app.py
+# The bot client and its web server. Started by bot.py.
+
+import time
+import logging
+import asyncio
+from pyrogram.enums import ParseMode
+from pyrogram.errors import FloodWait, BadRequest
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from pyromod import Client
+from aiohttp import web
+from config import Config
+from database.db import (
+    get_user, save_file_data, get_owner_db_channel, get_stream_channel, get_file_by_unique_id,
+    ensure_indexes
+)
+from utils.helpers import (
+    create_post, notify_and_remove_invalid_channel, get_title_key, BatchFile, parse_filename_async, backfill_file_fields,
+    prefetch_post_poster
+)
+from utils.cpu_pool import start_cpu_pool, stop_cpu_pool
+from utils.http_client import start_http_client, stop_http_client
+from utils.photo_cache import (
+    get_photo_file_id, remember_photo_file_id, forget_photo_file_id,
+    upload_lock as photo_upload_lock, release_upload_lock as release_photo_upload_lock
+)
+from utils.batch_scheduler import BatchScheduler
+from utils.ingest_queue import IngestQueue
+from features.importer import resume_imports
+from features.backup import resume_backups
+from features.overflow import resume_overflow, is_spilling
+from features.poster import cancel_poster_lookups
+from features.poster_index import load_poster_index
+from features.shortener import pregenerate_shortlinks
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+
+# Web Server Redirect Handler (for /get/... links)
+async def handle_redirect(request):
+    file_unique_id = request.match_info.get('file_unique_id', None)
+    if not file_unique_id: return web.Response(text="File ID missing.", status=400)
+    try:
+        with open(Config.BOT_USERNAME_FILE, 'r') as f: bot_username = f.read().strip().replace("@", "")
+    except FileNotFoundError:
+        logger.error(f"FATAL: Bot username file not found at {Config.BOT_USERNAME_FILE}")
+        return web.Response(text="Bot configuration error.", status=500)
+    return web.HTTPFound(f"https://t.me/{bot_username}?start=get_{file_unique_id}")
+
+
+class Bot(Client):
+    def __init__(self):
+        super().__init__("FinalStorageBot", api_id=Config.API_ID, api_hash=Config.API_HASH, bot_token=Config.BOT_TOKEN, plugins=dict(root="handlers"))
+        self.me = None
+        self.web_app = None
+        self.web_runner = None
+        
+        self.owner_db_channel_id = None
+        self.stream_channel_id = None
+        self.file_queue = IngestQueue(Config.INGEST_QUEUE_SIZE, Config.INGEST_OWNER_QUOTA, Config.IMPORT_CONCURRENCY)
+        self.batch_scheduler = BatchScheduler(self._finalize_batch, backlog=self._owner_backlog)
+        self.notification_flags = {}
+        self.notification_timers = {}
+        self.channel_locks = {}
+        self.pregen_tasks = set()
+        self.prefetch_tasks = set()
+        
+        self.vps_ip = Config.VPS_IP
+        self.vps_port = Config.VPS_PORT
+
+    def _owner_backlog(self, user_id):
+        """Arrival time of the owner's oldest unprocessed file, for the batch debounce."""
+        # Overflow files keep no arrival time here; they all arrived before anything now queued
+        if is_spilling(user_id): return 0.0
+        return self.file_queue.oldest_pending(user_id)
+
+    def _reset_notification_flag(self, key):
+        self.notification_flags[key] = False
+        logger.info(f"Notification flag reset for {key}.")
+
+    async def _post_to_channel(self, channel_id, posts):
+        """
+        Sends all parts of a post to a single channel in order. A per-channel lock keeps
+        the POST_INTERVAL gap between sends even when several batches target the same chat.
+        """
+        lock = self.channel_locks.setdefault(channel_id, asyncio.Lock())
+        async with lock:
+            for poster, caption, footer in posts:
+                with tracing.span('post_send'):
+                    if poster: await self._send_poster(channel_id, poster, caption, footer)
+                    else: await self.send_with_protection(self.send_message, channel_id, caption, reply_markup=footer, disable_web_page_preview=True)
+                await asyncio.sleep(Config.POST_INTERVAL)
+
+    async def _send_poster(self, channel_id, poster, caption, footer):
+        """
+        send_photo for a poster URL. The first upload records the photo's file_id and every
+        later send reuses it, so Telegram fetches each poster from the web only once.
+        """
+        file_id = await get_photo_file_id(poster)
+        if not file_id:
+            try:
+                async with photo_upload_lock(poster):
+                    file_id = await get_photo_file_id(poster)
+                    if not file_id: return await self._upload_poster(channel_id, poster, caption, footer)
+            finally:
+                # Waiters already hold the lock object; new senders find the file_id or upload again
+                release_photo_upload_lock(poster)
+        try:
+            return await self.send_with_protection(self.send_photo, channel_id, file_id, caption=caption, reply_markup=footer)
+        except BadRequest:
+            # The stored file_id is no longer accepted; send from the URL again
+            await forget_photo_file_id(poster)
+            return await self._upload_poster(channel_id, poster, caption, footer)
+
+    async def _upload_poster(self, channel_id, poster, caption, footer):
+        """Sends a poster from its URL and records the resulting photo file_id for later sends."""
+        sent = await self.send_with_protection(self.send_photo, channel_id, poster, caption=caption, reply_markup=footer)
+        if sent and sent.photo: await remember_photo_file_id(poster, sent.photo.file_id)
+        return sent
+
+    async def _finalize_batch(self, user_id, batch_key, files):
+        with tracing.trace_batch(user_id, batch_key):
+            await self._post_batch(user_id, batch_key, files)
+
+    async def _post_batch(self, user_id, batch_key, files):
+        notification_messages = []
+        try:
+            if not files: return
+            
+            batch_display_title = files[0].title
+
+            user = await get_user(user_id)
+            if not user: return
+            post_channels = user.get('post_channels', [])
+            if not post_channels: return
+
+            # Health checks for all post channels run concurrently
+            with tracing.span('health_check'):
+                checks = await asyncio.gather(*(notify_and_remove_invalid_channel(self, user_id, channel_id, "Post") for channel_id in post_channels))
+            valid_post_channels = [channel_id for channel_id, is_valid in zip(post_channels, checks) if is_valid]
+            
+            if not valid_post_channels:
+                logger.warning(f"User {user_id} has no valid post channels for batch '{batch_display_title}'.")
+                return
+
+            with tracing.span('create_post'):
+                posts_to_send = await create_post(self, user_id, files)
+            if Config.SHORTLINK_PREGENERATE:
+                # Shorten the new files' links while the post goes out, before anyone clicks them
+                task = asyncio.create_task(pregenerate_shortlinks(self.me.username, user_id, user, [f.file_unique_id for f in files]))
+                self.pregen_tasks.add(task)
+                task.add_done_callback(self.pregen_tasks.discard)
+            
+            # Fan out to every channel at once; each channel still receives its parts in order
+            results = await asyncio.gather(*(self._post_to_channel(channel_id, posts_to_send) for channel_id in valid_post_channels), return_exceptions=True)
+            for channel_id, result in zip(valid_post_channels, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to post batch '{batch_display_title}' to channel {channel_id}: {result}")
+        except Exception as e: 
+            logger.exception(f"Error finalizing batch {batch_key}: {e}")
+        finally:
+            for sent_msg in notification_messages:
+                await self.send_with_protection(sent_msg.delete)
+
+    async def _process_file(self, message, user_id, arrived_at=None):
+        if not self.owner_db_channel_id: self.owner_db_channel_id = await get_owner_db_channel()
+        if not self.owner_db_channel_id:
+            logger.error("Owner DB Channel is mandatory and not set. File processing skipped.")
+            return
+
+        if not self.stream_channel_id: self.stream_channel_id = await get_stream_channel()
+        
+        with tracing.span('copy_db'):
+            copied_message = await self.send_with_protection(message.copy, self.owner_db_channel_id)
+        if not copied_message: return
+
+        if self.stream_channel_id and self.stream_channel_id != self.owner_db_channel_id:
+            with tracing.span('copy_stream'):
+                stream_message = await self.send_with_protection(message.copy, self.stream_channel_id)
+            if not stream_message: return
+        else:
+            stream_message = copied_message
+
+        media = getattr(copied_message, copied_message.media.value)
+        batch_file = BatchFile.from_message(copied_message, await parse_filename_async(media.file_name))
+        with tracing.span('save_file'):
+            await save_file_data(user_id, message, copied_message, stream_message, batch_file.meta)
+        
+        title_key = get_title_key(batch_file.file_name)
+        if not title_key:
+            logger.warning(f"Could not generate a title key for filename: {batch_file.file_name}")
+            return
+
+        tracing.bind_batch(title_key)
+        if self.batch_scheduler.add(user_id, title_key, batch_file, arrived_at):
+            logger.info(f"Created new batch with key '{title_key}'")
+            # Resolve the poster during the debounce window instead of after it
+            task = asyncio.create_task(prefetch_post_poster(user_id, batch_file))
+            self.prefetch_tasks.add(task)
+            task.add_done_callback(self.prefetch_tasks.discard)
+        else:
+            logger.info(f"Added to batch with key '{title_key}'")
+
+    async def file_processor_worker(self):
+        logger.info("File Processor Worker started.")
+        while True:
+            message, user_id, waited = await self.file_queue.get()
+            try:
+                with tracing.trace_file(user_id):
+                    tracing.record('queue_wait', waited)
+                    await self._process_file(message, user_id, time.monotonic() - waited)
+            except Exception as e:
+                logger.exception(f"CRITICAL Error in file_processor_worker: {e}")
+            finally:
+                self.file_queue.task_done(user_id)
+
+    async def send_with_protection(self, coro, *args, **kwargs):
+        while True:
+            try:
+                return await coro(*args, **kwargs)
+            except FloodWait as e:
+                logger.warning(f"FloodWait of {e.value}s detected. Sleeping..."); await asyncio.sleep(e.value + 2)
+            except Exception as e:
+                logger.error(f"SEND_PROTECTION: An error occurred: {e}"); raise
+
+    async def start_web_server(self):
+        from server.stream_routes import routes as stream_routes
+        self.web_app = web.Application()
+        self.web_app['bot'] = self
+        self.web_app.router.add_get("/get/{file_unique_id}", handle_redirect)
+        self.web_app.add_routes(stream_routes)
+        self.web_runner = web.AppRunner(self.web_app)
+        await self.web_runner.setup()
+        site = web.TCPSite(self.web_runner, self.vps_ip, self.vps_port)
+        await site.start()
+        logger.info(f"Web server started at http://{self.vps_ip}:{self.vps_port}")
+
+    async def _backfill_file_fields(self):
+        try:
+            count = await backfill_file_fields()
+            if count: logger.info(f"Stored title keys and search tokens for {count} older files.")
+        except Exception:
+            logger.exception("File fields backfill failed.")
+
+    async def _load_poster_index(self):
+        try:
+            await asyncio.to_thread(load_poster_index, Config.POSTER_INDEX_PATH)
+        except Exception:
+            logger.exception(f"Could not load the poster index from {Config.POSTER_INDEX_PATH}.")
+
+    async def start(self):
+        await start_cpu_pool(Config.CPU_POOL_WORKERS)
+        await start_http_client()
+        if Config.POSTER_INDEX_PATH: asyncio.create_task(self._load_poster_index())
+        await super().start()
+        self.me = await self.get_me()
+        await ensure_indexes()
+        self.owner_db_channel_id = await get_owner_db_channel()
+        self.stream_channel_id = await get_stream_channel()
+        if self.owner_db_channel_id: logger.info(f"Loaded Owner DB ID [{self.owner_db_channel_id}]")
+        else: logger.warning("Owner DB ID not set. Use 'Set Owner DB' as admin.")
+        if self.stream_channel_id: logger.info(f"Loaded Stream Channel ID [{self.stream_channel_id}]")
+        else: logger.info("Stream Channel not set. Will use Owner DB for streaming.")
+        try:
+            with open(Config.BOT_USERNAME_FILE, 'w') as f: f.write(f"@{self.me.username}")
+            logger.info(f"Updated bot username to @{self.me.username}")
+        except Exception as e: logger.error(f"Could not write to {Config.BOT_USERNAME_FILE}: {e}")
+        self.batch_scheduler.start()
+        asyncio.create_task(self.file_processor_worker())
+        asyncio.create_task(resume_overflow(self))
+        asyncio.create_task(resume_imports(self))
+        asyncio.create_task(resume_backups(self))
+        asyncio.create_task(self._backfill_file_fields())
+        await self.start_web_server()
+        logger.info(f"Bot @{self.me.username} started successfully.")
+
+    async def stop(self, *args):
+        logger.info("Stopping bot...")
+        await self.batch_scheduler.stop()
+        cancel_poster_lookups()
+        await stop_cpu_pool()
+        await stop_http_client()
+        if self.web_runner: await self.web_runner.cleanup()
+        await super().stop()
+        logger.info("Bot stopped.")
@@ -0,0 +1,128 @@
+# bench_parsing.py
+# Throughput and allocation benchmarks for filename parsing, title keys and post building.
+#
+#   python -m benchmarks.bench_parsing                          # run and print results
+#   python -m benchmarks.bench_parsing --save baseline.json     # record a baseline
+#   python -m benchmarks.bench_parsing --compare baseline.json  # compare, exit 1 on regression
+
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tracemalloc
+
+from benchmarks.corpus import make_corpus
+from utils.filename_parser import parse_filename_uncached, title_key
+from utils.grouping import group_titles
+from utils import helpers
+from utils.helpers import (
+    BatchFile, clean_filename, get_title_key, calculate_title_similarity,
+    natural_sort_key, format_file_entry, split_captions, PHOTO_CAPTION_LIMIT
+)
+
+# Files per post when benchmarking caption splitting
+POST_BATCH_SIZE = 25
+
+
+def _build_cases(corpus):
+    """name -> (operations per pass, function running one pass)."""
+    metas = [parse_filename_uncached(name) for name in corpus]
+    titles = [meta.title for meta in metas]
+    pairs = list(zip(titles, titles[1:] + titles[:1]))
+    files = [BatchFile(f"uid{i}", name, 1024 * i, i, meta) for i, (name, meta) in enumerate(zip(corpus, metas))]
+    entries = [format_file_entry(1, f) for f in files]
+    batches = [entries[i:i + POST_BATCH_SIZE] for i in range(0, len(entries), POST_BATCH_SIZE)]
+    header = "🎬 **Some Movie Title (2023)**"
+
+    return {
+        'parse_filename (uncached)': (len(corpus), lambda: [parse_filename_uncached(name) for name in corpus]),
+        'clean_filename (cached)': (len(corpus), lambda: [clean_filename(name) for name in corpus]),
+        'get_title_key (cached)': (len(corpus), lambda: [get_title_key(name) for name in corpus]),
+        'title_key': (len(titles), lambda: [title_key(title) for title in titles]),
+        'calculate_title_similarity': (len(pairs), lambda: [calculate_title_similarity(a, b) for a, b in pairs]),
+        'natural_sort_key': (len(corpus), lambda: [natural_sort_key(name) for name in corpus]),
+        'format_file_entry': (len(files), lambda: [format_file_entry(1, f) for f in files]),
+        'split_captions': (len(batches), lambda: [split_captions(header, batch, PHOTO_CAPTION_LIMIT) for batch in batches]),
+        'group_titles': (len(titles), lambda: group_titles(titles)),
+    }
+
+
+def _measure(ops, func, repeat):
+    func()  # Warm-up pass; also fills the filename cache for the "(cached)" cases
+    best = min(_timed(func) for _ in range(repeat))
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'ops_per_sec': ops / best, 'alloc_peak_kib': (peak - before) / 1024, 'bytes_per_op': (peak - before) / ops}
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(size, repeat, only=None):
+    corpus = make_corpus(size)
+    results = {}
+    for name, (ops, func) in _build_cases(corpus).items():
+        if only and only not in name: continue
+        helpers._file_meta_cache.clear()
+        results[name] = _measure(ops, func, repeat)
+        r = results[name]
+        print(f"{name:<30} {r['ops_per_sec']:>14,.0f} ops/s {r['alloc_peak_kib']:>10,.1f} KiB peak {r['bytes_per_op']:>9,.0f} B/op")
+    return {'python': platform.python_version(), 'corpus_size': size, 'results': results}
+
+
+def compare(report, baseline, threshold):
+    """Prints the change against a baseline and returns True if anything regressed beyond `threshold` percent."""
+    regressed = False
+    print(f"\nCompared with baseline (python {baseline.get('python')}, corpus {baseline.get('corpus_size')}):")
+    for name, r in report['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            print(f"{name:<30} (no baseline)")
+            continue
+        speed = (r['ops_per_sec'] / base['ops_per_sec'] - 1) * 100
+        alloc = (r['alloc_peak_kib'] / base['alloc_peak_kib'] - 1) * 100 if base['alloc_peak_kib'] else 0.0
+        flag = ""
+        if speed < -threshold or alloc > threshold:
+            flag, regressed = "  << REGRESSION", True
+        print(f"{name:<30} speed {speed:+7.1f}%   alloc {alloc:+7.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks filename parsing, title keys and post building.")
+    parser.add_argument('--size', type=int, default=2000, help="filenames in the corpus")
+    parser.add_argument('--repeat', type=int, default=5, help="timed passes per case; the best one is reported")
+    parser.add_argument('--only', help="run only cases whose name contains this text")
+    parser.add_argument('--save', metavar='PATH', help="write the results as a baseline JSON file")
+    parser.add_argument('--compare', metavar='PATH', help="compare against a baseline JSON file")
+    parser.add_argument('--threshold', type=float, default=10.0, help="allowed slowdown / extra allocation, in percent")
+    args = parser.parse_args()
+
+    # PTN fallbacks log a warning per odd filename; keep the output readable
+    logging.disable(logging.WARNING)
+    report = run(args.size, args.repeat, args.only)
+
+    if args.save:
+        with open(args.save, 'w') as f: json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)
+        if report['corpus_size'] != baseline.get('corpus_size'):
+            print("Warning: corpus size differs from the baseline; results are not directly comparable.")
+        if compare(report, baseline, args.threshold): sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# corpus.py
+# Deterministic, release-style filenames for the benchmarks. The same seed always
+# yields the same corpus so runs are comparable with a saved baseline.
+
+import random
+
+MOVIE_TITLES = [
+    "The Dark Knight", "Inception", "Interstellar", "Pathaan", "Jawan", "RRR", "KGF Chapter 2",
+    "Dune Part Two", "Oppenheimer", "Spider-Man Across the Spider-Verse", "Drishyam 2", "Animal",
+    "The Batman", "Avatar The Way of Water", "Top Gun Maverick", "Pushpa The Rise", "Leo",
+    "John Wick Chapter 4", "Guardians of the Galaxy Vol 3", "Mission Impossible Dead Reckoning",
+]
+SERIES_TITLES = [
+    "Breaking Bad", "Money Heist", "Stranger Things", "The Family Man", "Mirzapur", "House of the Dragon",
+    "The Last of Us", "Farzi", "Sacred Games", "The Boys", "Loki", "Panchayat", "Game of Thrones",
+]
+RESOLUTIONS = ["480p", "720p", "1080p", "2160p", "4K"]
+SOURCES = ["BluRay", "WEB-DL", "WEBRip", "HDRip", "HDTV", "DVDRip", "AMZN WEB-DL", "NF WEB-DL"]
+CODECS = ["x264", "x265", "H.264", "HEVC", "H 265", "10bit x265"]
+AUDIO = ["AAC", "AAC2.0", "DD5.1", "DDP5.1", "Atmos", "Dual Audio Hindi English", "Hindi"]
+GROUPS = ["YTS", "RARBG", "NTb", "PSA", "Pahe", "TEPES", "FLUX", "GalaxyRG"]
+MENTIONS = ["@MoviesHub", "@TeamHDHub", "@CineVood", "@BollyFlix", "[Join Us On Telegram]", "www.1TamilMV.cafe -"]
+EXTENSIONS = ["mkv", "mp4", "avi"]
+
+
+def _dotted(text, rng):
+    sep = rng.choice([".", " ", "_", "."])
+    return text.replace(" ", sep)
+
+
+def _movie(rng):
+    title = rng.choice(MOVIE_TITLES)
+    year = rng.randint(1995, 2024)
+    parts = [title, str(year) if rng.random() < 0.85 else f"({year})", rng.choice(RESOLUTIONS), rng.choice(SOURCES)]
+    if rng.random() < 0.6: parts.append(rng.choice(AUDIO))
+    parts.append(rng.choice(CODECS))
+    name = _dotted(" ".join(parts), rng)
+    if rng.random() < 0.7: name += f"-{rng.choice(GROUPS)}"
+    return name
+
+
+def _episode(rng):
+    title = rng.choice(SERIES_TITLES)
+    season, episode = rng.randint(1, 8), rng.randint(1, 24)
+    parts = [title, f"S{season:02d}E{episode:02d}", rng.choice(RESOLUTIONS), rng.choice(SOURCES), rng.choice(CODECS)]
+    if rng.random() < 0.3: parts.insert(2, "Episode Name Here")
+    return _dotted(" ".join(parts), rng) + f"-{rng.choice(GROUPS)}"
+
+
+def _pack(rng):
+    title = rng.choice(SERIES_TITLES)
+    season = rng.randint(1, 8)
+    first = rng.randint(1, 5)
+    form = rng.choice([f"S{season:02d}E{first:02d}-E{first + rng.randint(2, 9):02d}",
+                       f"S{season:02d} Complete", f"Season {season} Complete", f"S{season:02d}E{first:02d}E{first + 1:02d}"])
+    return _dotted(f"{title} {form} {rng.choice(RESOLUTIONS)} {rng.choice(SOURCES)} {rng.choice(AUDIO)}", rng)
+
+
+def _with_spam(name, rng):
+    mention = rng.choice(MENTIONS)
+    return f"{mention} {name}" if rng.random() < 0.5 else f"{name} {mention}"
+
+
+def make_corpus(size=2000, seed=1337):
+    """Returns `size` filenames: movies, single episodes and multi-episode packs, many carrying mention/spam tags."""
+    rng = random.Random(seed)
+    names = []
+    for _ in range(size):
+        kind = rng.random()
+        name = _movie(rng) if kind < 0.45 else _episode(rng) if kind < 0.85 else _pack(rng)
+        if rng.random() < 0.35: name = _with_spam(name, rng)
+        names.append(f"{name}.{rng.choice(EXTENSIONS)}")
+    return names
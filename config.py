@@ -17,6 +17,38 @@ class Config:
     
     # --- TMDB API Key (Optional, for posters) ---
     TMDB_API_KEY = os.environ.get("TMDB_API_KEY", "5a318417c7f4a722afd9d71df548877b")
+
+    # Poster lookups are cached per (title, year); misses are cached for a shorter time
+    POSTER_CACHE_TTL = int(os.environ.get("POSTER_CACHE_TTL", 7 * 24 * 3600))
+    POSTER_NEGATIVE_TTL = int(os.environ.get("POSTER_NEGATIVE_TTL", 6 * 3600))
+    POSTER_CACHE_SIZE = int(os.environ.get("POSTER_CACHE_SIZE", 1024))
+    # Optional offline title/poster dump (.tsv, .json or .jsonl, may be gzipped) checked before any web lookup
+    POSTER_INDEX_PATH = os.environ.get("POSTER_INDEX_PATH")
+    POSTER_INDEX_FUZZY_CUTOFF = float(os.environ.get("POSTER_INDEX_FUZZY_CUTOFF", 92))
+    # Most index titles scored by one fuzzy lookup
+    POSTER_INDEX_FUZZY_LIMIT = int(os.environ.get("POSTER_INDEX_FUZZY_LIMIT", 20000))
+    # Poster source lookups run in parallel, in priority order, within an overall deadline (seconds)
+    POSTER_LOOKUP_CONCURRENCY = int(os.environ.get("POSTER_LOOKUP_CONCURRENCY", 4))
+    POSTER_LOOKUP_DEADLINE = float(os.environ.get("POSTER_LOOKUP_DEADLINE", 20))
+
+    # Shared outbound HTTP client (poster sources, URL shorteners)
+    HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 100))
+    HTTP_PER_HOST_LIMIT = int(os.environ.get("HTTP_PER_HOST_LIMIT", 10))
+    HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 10))
+    HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 2))
+
+    # Shortened links are cached per owner/shortener/link. With SHORTLINK_PREGENERATE on, the links
+    # of newly posted files are shortened right away; this spends the owners' shortener quota on
+    # links that may never be clicked, so it is off by default
+    SHORTLINK_PREGENERATE = os.environ.get("SHORTLINK_PREGENERATE", "false").lower() == "true"
+    SHORTLINK_CACHE_TTL = int(os.environ.get("SHORTLINK_CACHE_TTL", 7 * 24 * 3600))
+    SHORTLINK_CACHE_SIZE = int(os.environ.get("SHORTLINK_CACHE_SIZE", 4096))
+    SHORTLINK_PREGEN_CONCURRENCY = int(os.environ.get("SHORTLINK_PREGEN_CONCURRENCY", 5))
+    # A shortener call gives up after this many seconds, retries included
+    SHORTENER_DEADLINE = float(os.environ.get("SHORTENER_DEADLINE", 8))
+    # A domain's circuit opens after this many consecutive failures and stays open for the cooldown (seconds)
+    BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))
+    BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", 60))
     
     # --- Your VPS IP Address and Port for the Web Server ---
     VPS_IP = os.environ.get("VPS_IP", "65.21.183.36")
@@ -26,6 +58,46 @@ class Config:
     
     # The name of the file that stores your bot's username (for the redirector)
     BOT_USERNAME_FILE = "bot_username.txt"
+
+    # Minimum gap (in seconds) between two posts sent to the same channel
+    POST_INTERVAL = float(os.environ.get("POST_INTERVAL", 2))
+
+    # --- Batch debounce (seconds) ---
+    # A batch holding a single file closes after BATCH_SINGLE_DELAY. While files keep
+    # arriving, the wait follows their average gap, clamped between the MIN and MAX delay.
+    # No batch stays open longer than BATCH_MAX_AGE. All of these count from when files were
+    # received, and a batch also waits for that owner's files still queued from inside its window.
+    BATCH_SINGLE_DELAY = float(os.environ.get("BATCH_SINGLE_DELAY", 5))
+    BATCH_MIN_DELAY = float(os.environ.get("BATCH_MIN_DELAY", 3))
+    BATCH_MAX_DELAY = float(os.environ.get("BATCH_MAX_DELAY", 20))
+    BATCH_GAP_FACTOR = float(os.environ.get("BATCH_GAP_FACTOR", 3))
+    BATCH_MAX_AGE = float(os.environ.get("BATCH_MAX_AGE", 120))
+
+    # --- Ingestion queue ---
+    # Total files waiting to be processed, and how many of them one owner may hold;
+    # files beyond that are recorded in Mongo and queued as room frees up
+    INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 1000))
+    INGEST_OWNER_QUOTA = int(os.environ.get("INGEST_OWNER_QUOTA", 200))
+    # How many imported (old) files may be queued at once; imports only use idle worker time
+    IMPORT_CONCURRENCY = int(os.environ.get("IMPORT_CONCURRENCY", 50))
+
+    # Worker processes for filename parsing and fuzzy matching (0 = one per CPU core)
+    CPU_POOL_WORKERS = int(os.environ.get("CPU_POOL_WORKERS", 0))
+
+    # User settings documents cached in memory (seconds, entries); writes through db.py invalidate them
+    USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 300))
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 5000))
+
+    # File search: most results kept per search, and how the fuzzy fallback gathers and filters candidates
+    SEARCH_RESULT_LIMIT = int(os.environ.get("SEARCH_RESULT_LIMIT", 500))
+    SEARCH_FUZZY_CANDIDATES = int(os.environ.get("SEARCH_FUZZY_CANDIDATES", 2000))
+    SEARCH_FUZZY_CUTOFF = float(os.environ.get("SEARCH_FUZZY_CUTOFF", 75))
+    # How long a search's results stay pageable (seconds), and how many users' searches are kept
+    SEARCH_SESSION_TTL = float(os.environ.get("SEARCH_SESSION_TTL", 1800))
+    SEARCH_SESSION_LIMIT = int(os.environ.get("SEARCH_SESSION_LIMIT", 1000))
+
+    # Posts per minute shared by all running Smart Backups
+    BACKUP_POSTS_PER_MINUTE = int(os.environ.get("BACKUP_POSTS_PER_MINUTE", 20))
     
     # ================================================================= #
     # VVVVVV YAHAN PAR NAYA TUTORIAL LINK ADD KIYA GAYA HAI VVVVVV #
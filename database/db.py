@@ -1,7 +1,13 @@
+import copy
+import time
 import datetime
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
 from config import Config
+from utils.filename_parser import title_key, search_tokens
+from utils.lru_cache import LRUCache
 
 client = AsyncIOMotorClient(Config.MONGO_URI)
 db = client[Config.DATABASE_NAME]
@@ -11,6 +17,12 @@ users = db['users']
 files = db['files']
 bot_settings = db['bot_settings']
 verified_users = db['verified_users']
+import_jobs = db['import_jobs']
+backup_jobs = db['backup_jobs']
+poster_cache = db['poster_cache']
+photo_file_ids = db['photo_file_ids']
+shortlinks = db['shortlinks']
+ingest_overflow = db['ingest_overflow']
 
 async def add_user(user_id):
     """Adds a new user to the database if they don't already exist."""
@@ -22,13 +34,14 @@ async def add_user(user_id):
         'shortener_mode': 'each_time'
     }
     await users.update_one({'user_id': user_id}, {"$setOnInsert": user_data}, upsert=True)
+    invalidate_user(user_id)
 
 async def is_user_verified(requester_id: int, owner_id: int) -> bool:
     try:
         verification = await verified_users.find_one({'requester_id': requester_id, 'owner_id': owner_id})
         if not verification or 'verified_at' not in verification or not isinstance(verification['verified_at'], datetime.datetime):
             return False
-        twelve_hours_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=12)
+        twelve_hours_ago = datetime.datetime.utcnow() - datetime.timedelta(seconds=VERIFICATION_TTL)
         return verification['verified_at'] > twelve_hours_ago
     except Exception as e:
         logger.error(f"An error occurred in is_user_verified check: {e}")
@@ -72,11 +85,12 @@ async def get_owner_db_channel():
     config = await bot_settings.find_one({'_id': 'owner_db_config'})
     return config.get('channel_id') if config else None
 
-async def save_file_data(owner_id, original_message, copied_message, stream_message):
-    """Saves file metadata, including the new stream_id."""
-    from utils.helpers import get_file_raw_link
+async def save_file_data(owner_id, original_message, copied_message, stream_message, meta=None):
+    """Saves file metadata, including the new stream_id and the parsed filename record."""
+    from utils.helpers import get_file_raw_link, parse_filename
     original_media = getattr(original_message, original_message.media.value)
     raw_link = await get_file_raw_link(copied_message)
+    meta = meta or parse_filename(original_media.file_name)
     file_data = {
         'owner_id': owner_id,
         'file_unique_id': original_media.file_unique_id,
@@ -84,7 +98,11 @@ async def save_file_data(owner_id, original_message, copied_message, stream_mess
         'stream_id': stream_message.id,
         'file_name': original_media.file_name,
         'file_size': original_media.file_size,
-        'raw_link': raw_link
+        'raw_link': raw_link,
+        'meta': meta._asdict(),
+        'title_key': title_key(meta.title),
+        'year': meta.year,
+        'search_tokens': search_tokens(meta)
     }
     # --- BUG FIX: The query now includes owner_id to make the document unique per user ---
     # This is the most critical change. It creates a new document for each user-file pair.
@@ -93,8 +111,89 @@ async def save_file_data(owner_id, original_message, copied_message, stream_mess
         {'$set': file_data}, upsert=True
     )
 
+# --- Index bootstrap: every index the bot's queries rely on, created on start ---
+VERIFICATION_TTL = 12 * 3600
+INDEXES = {
+    files: [
+        ([('owner_id', 1), ('file_unique_id', 1)], {'unique': True}),
+        ([('owner_id', 1), ('_id', -1)], {}),
+        ([('owner_id', 1), ('title_key', 1), ('_id', 1)], {}),
+        ([('owner_id', 1), ('search_tokens', 1)], {}),
+    ],
+    users: [
+        ([('user_id', 1)], {'unique': True}),
+        ([('db_channels', 1)], {}),
+    ],
+    verified_users: [
+        ([('requester_id', 1), ('owner_id', 1)], {'unique': True}),
+        ([('verified_at', 1)], {'expireAfterSeconds': VERIFICATION_TTL}),
+    ],
+    import_jobs: [([('status', 1)], {})],
+    backup_jobs: [([('status', 1)], {})],
+    poster_cache: [([('expires_at', 1)], {'expireAfterSeconds': 0})],
+    shortlinks: [([('expires_at', 1)], {'expireAfterSeconds': 0})],
+    ingest_overflow: [([('owner_id', 1), ('_id', 1)], {})],
+}
+
+async def _create_index(collection, keys, options):
+    try:
+        await collection.create_index(keys, **options)
+    except OperationFailure as e:
+        if options.get('unique') and e.code == 11000:
+            # Older data can hold duplicates; keep the lookups fast while they remain
+            logger.warning(f"Duplicate {keys} values in '{collection.name}'; creating a non-unique index instead.")
+            await _create_index(collection, keys, {k: v for k, v in options.items() if k != 'unique'})
+        else:
+            logger.warning(f"Could not create index {keys} on '{collection.name}': {e}")
+
+async def ensure_indexes():
+    """Creates the indexes the bot's queries rely on. Safe to run on every start."""
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            await _create_index(collection, keys, options)
+
+async def get_index_report():
+    """
+    Per collection: the expected indexes that are missing, and existing indexes that have
+    not been used since the server last started (from $indexStats).
+    """
+    report = {}
+    for collection, indexes in INDEXES.items():
+        existing = await collection.index_information()
+        existing_keys = {tuple((k, d if isinstance(d, str) else int(d)) for k, d in info['key']) for info in existing.values()}
+        missing = [keys for keys, _ in indexes if tuple(keys) not in existing_keys]
+        usage = await collection.aggregate([{'$indexStats': {}}]).to_list(length=None)
+        unused = [u['name'] for u in usage if u['name'] != '_id_' and u['accesses']['ops'] == 0]
+        report[collection.name] = {'missing': missing, 'unused': unused, 'total': len(existing)}
+    return report
+
+# --- Read-through cache of user documents; every write below invalidates the user's entry ---
+_user_cache = LRUCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)  # user_id -> document or None
+_MISSING = object()
+_user_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+def invalidate_user(user_id):
+    _user_cache_stats['invalidations'] += 1
+    _user_cache.pop(user_id, None)
+
+def get_user_cache_stats():
+    lookups = _user_cache_stats['hits'] + _user_cache_stats['misses']
+    return {**_user_cache_stats, 'size': len(_user_cache), 'hit_rate': _user_cache_stats['hits'] / lookups if lookups else 0.0}
+
 async def get_user(user_id):
-    return await users.find_one({'user_id': user_id})
+    cached = _user_cache.get(user_id, _MISSING)
+    if cached is not _MISSING:
+        _user_cache_stats['hits'] += 1
+        # A copy, so callers can never modify the cached document
+        return copy.deepcopy(cached)
+    _user_cache_stats['misses'] += 1
+    invalidations = _user_cache_stats['invalidations']
+    user = await users.find_one({'user_id': user_id})
+    # Skip caching if a write landed while we were reading; the document may predate it
+    if _user_cache_stats['invalidations'] == invalidations:
+        _user_cache.set(user_id, user)
+        return copy.deepcopy(user)
+    return user
 
 async def get_all_user_ids(storage_owners_only=False):
     query = {}
@@ -117,10 +216,13 @@ async def get_storage_owners_count():
     return await users.count_documents(query)
 async def update_user(user_id, key, value):
     await users.update_one({'user_id': user_id}, {'$set': {key: value}}, upsert=True)
+    invalidate_user(user_id)
 async def add_to_list(user_id, list_name, item):
     await users.update_one({'user_id': user_id}, {'$addToSet': {list_name: item}})
+    invalidate_user(user_id)
 async def remove_from_list(user_id, list_name, item):
     await users.update_one({'user_id': user_id}, {'$pull': {list_name: item}})
+    invalidate_user(user_id)
 async def find_owner_by_db_channel(channel_id):
     user = await users.find_one({'db_channels': channel_id})
     return user['user_id'] if user else None
@@ -130,28 +232,157 @@ async def get_file_by_unique_id(owner_id: int, file_unique_id: str):
     """Fetches a file based on its owner and unique_id."""
     return await files.find_one({'owner_id': owner_id, 'file_unique_id': file_unique_id})
 
+# Approximate per-owner file counts for listings: owner_id -> (count, expiry as time.monotonic())
+FILE_COUNT_TTL = 60
+_file_count_cache = {}
+
 async def get_user_file_count(owner_id):
     return await files.count_documents({'owner_id': owner_id})
 async def get_all_user_files(user_id):
     return files.find({'owner_id': user_id})
-async def get_paginated_files(user_id, page: int, page_size: int = 5):
-    skip = (page - 1) * page_size
-    cursor = files.find({'owner_id': user_id}).sort('_id', -1).skip(skip).limit(page_size)
-    return await cursor.to_list(length=page_size)
-async def search_user_files(user_id, query: str, page: int, page_size: int = 5):
-    search_filter = {'owner_id': user_id, 'file_name': {'$regex': query, '$options': 'i'}}
-    skip = (page - 1) * page_size
-    total_files = await files.count_documents(search_filter)
-    cursor = files.find(search_filter).sort('_id', -1).skip(skip).limit(page_size)
-    files_list = await cursor.to_list(length=page_size)
-    return files_list, total_files
+async def get_approx_file_count(owner_id):
+    """get_user_file_count, cached for FILE_COUNT_TTL seconds; good enough for 'N Total' labels."""
+    cached = _file_count_cache.get(owner_id)
+    if cached and cached[1] > time.monotonic(): return cached[0]
+    count = await files.count_documents({'owner_id': owner_id})
+    _file_count_cache[owner_id] = (count, time.monotonic() + FILE_COUNT_TTL)
+    return count
+async def get_files_page(user_id, page_size: int = 5, before_id=None, after_id=None):
+    """
+    Keyset page of an owner's files, newest first. Pass the last _id shown as before_id for
+    the next page, or the first _id shown as after_id for the previous one. Returns
+    (files, has_more), where has_more says whether more files lie beyond in that direction.
+    Costs O(page_size) at any depth thanks to the (owner_id, _id) index.
+    """
+    query = {'owner_id': user_id}
+    if after_id is not None:
+        query['_id'] = {'$gt': after_id}
+        cursor = files.find(query).sort('_id', 1).limit(page_size + 1)
+    else:
+        if before_id is not None: query['_id'] = {'$lt': before_id}
+        cursor = files.find(query).sort('_id', -1).limit(page_size + 1)
+    page = await cursor.to_list(length=page_size + 1)
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    if after_id is not None: page.reverse()
+    return page, has_more
+# --- File search over the indexed search_tokens ---
+SEARCH_PROJECTION = {'_id': 1, 'owner_id': 1, 'file_unique_id': 1, 'file_name': 1, 'meta': 1}
+async def find_files_with_all_tokens(owner_id, tokens, limit):
+    cursor = files.find({'owner_id': owner_id, 'search_tokens': {'$all': list(tokens)}}, SEARCH_PROJECTION).sort('_id', -1).limit(limit)
+    return await cursor.to_list(length=limit)
+async def find_files_with_any_token(owner_id, tokens, limit):
+    cursor = files.find({'owner_id': owner_id, 'search_tokens': {'$in': list(tokens)}}, SEARCH_PROJECTION).sort('_id', -1).limit(limit)
+    return await cursor.to_list(length=limit)
+async def get_files_by_ids(owner_id, ids):
+    """Files by _id, returned in the order of `ids`."""
+    docs = await files.find({'owner_id': owner_id, '_id': {'$in': list(ids)}}, SEARCH_PROJECTION).to_list(length=len(ids))
+    by_id = {doc['_id']: doc for doc in docs}
+    return [by_id[i] for i in ids if i in by_id]
 async def total_users_count():
     return await users.count_documents({})
 async def add_footer_button(user_id, button_name, button_url):
     button = {'name': button_name, 'url': button_url}
     await users.update_one({'user_id': user_id}, {'$push': {'footer_buttons': button}})
+    invalidate_user(user_id)
 async def remove_footer_button(user_id, button_name):
     await users.update_one({'user_id': user_id}, {'$pull': {'footer_buttons': {'name': button_name}}})
+    invalidate_user(user_id)
 async def delete_all_files():
     result = await files.delete_many({})
     return result.deleted_count
+
+# --- History import jobs (one per owner) ---
+async def get_import_job(owner_id):
+    return await import_jobs.find_one({'_id': owner_id})
+async def save_import_job(owner_id, fields: dict):
+    fields['updated_at'] = datetime.datetime.utcnow()
+    await import_jobs.update_one({'_id': owner_id}, {'$set': fields}, upsert=True)
+async def get_running_import_jobs():
+    return await import_jobs.find({'status': 'running'}).to_list(length=None)
+async def get_stored_unique_ids(owner_id, file_unique_ids):
+    """Returns the subset of file_unique_ids already saved for this owner."""
+    cursor = files.find({'owner_id': owner_id, 'file_unique_id': {'$in': list(file_unique_ids)}}, {'file_unique_id': 1, '_id': 0})
+    return {doc['file_unique_id'] for doc in await cursor.to_list(length=None)}
+
+# --- Smart Backup jobs (one per owner) ---
+BACKUP_FILE_PROJECTION = {'_id': 0, 'file_unique_id': 1, 'file_name': 1, 'file_size': 1, 'file_id': 1, 'meta': 1}
+async def get_files_by_unique_ids(owner_id, file_unique_ids):
+    cursor = files.find({'owner_id': owner_id, 'file_unique_id': {'$in': list(file_unique_ids)}}, BACKUP_FILE_PROJECTION)
+    return await cursor.to_list(length=None)
+async def get_backup_job(owner_id):
+    return await backup_jobs.find_one({'_id': owner_id})
+async def save_backup_job(owner_id, fields: dict):
+    fields['updated_at'] = datetime.datetime.utcnow()
+    await backup_jobs.update_one({'_id': owner_id}, {'$set': fields}, upsert=True)
+async def get_running_backup_jobs():
+    return await backup_jobs.find({'status': 'running'}, {'plan': 0}).to_list(length=None)
+
+# --- Title grouping (files are grouped server-side by their stored title_key) ---
+def get_title_groups(owner_id):
+    """
+    An owner's files grouped by title_key, as an async cursor. Each group is
+    {'_id': title_key, 'first_id': _id of its oldest file, 'file_unique_ids': [...]} with
+    files in the order they were saved; groups come in the order their first file was saved.
+    Files with an empty title_key (no title could be parsed from the name) fail the '$gt'
+    match and are left out, so Smart Backup does not post them.
+    """
+    pipeline = [
+        {'$match': {'owner_id': owner_id, 'title_key': {'$gt': ''}}},
+        # Served by the (owner_id, title_key, _id) index, so the files are read in order without a sort
+        {'$sort': {'title_key': 1, '_id': 1}},
+        {'$group': {'_id': '$title_key', 'first_id': {'$min': '$_id'}, 'file_unique_ids': {'$push': '$file_unique_id'}}},
+        # Sorts the groups only (one per distinct title), not the files
+        {'$sort': {'first_id': 1}}
+    ]
+    return files.aggregate(pipeline, allowDiskUse=True)
+async def get_files_to_backfill(owner_id=None, limit=1000):
+    """Files saved before title_key and search_tokens were stored."""
+    query = {'search_tokens': {'$exists': False}}
+    if owner_id is not None: query['owner_id'] = owner_id
+    return await files.find(query, {'_id': 1, 'file_name': 1}).limit(limit).to_list(length=limit)
+async def set_file_fields(updates):
+    """updates: (document _id, fields to $set) pairs, written in one bulk request."""
+    if updates: await files.bulk_write([UpdateOne({'_id': _id}, {'$set': fields}) for _id, fields in updates], ordered=False)
+
+# --- Poster lookup cache (url is None for titles with no poster) ---
+async def get_cached_poster(key):
+    """Returns the cache document for a poster key, or None if missing or expired."""
+    doc = await poster_cache.find_one({'_id': key})
+    # Mongo's TTL monitor only runs once a minute, so check expiry here as well
+    if doc and doc['expires_at'] > datetime.datetime.utcnow(): return doc
+    return None
+async def save_cached_poster(key, url, ttl):
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+    await poster_cache.update_one({'_id': key}, {'$set': {'url': url, 'expires_at': expires_at}}, upsert=True)
+
+# --- Telegram file_ids of uploaded poster photos, keyed by poster URL ---
+async def get_photo_file_id(url):
+    doc = await photo_file_ids.find_one({'_id': url})
+    return doc['file_id'] if doc else None
+async def save_photo_file_id(url, file_id):
+    await photo_file_ids.update_one({'_id': url}, {'$set': {'file_id': file_id, 'updated_at': datetime.datetime.utcnow()}}, upsert=True)
+async def delete_photo_file_id(url):
+    await photo_file_ids.delete_one({'_id': url})
+
+# --- Shortened link cache, keyed by owner, shortener and target link ---
+async def get_cached_shortlink(key):
+    """Returns the cache document ({'url', 'expires_at'}) for a shortlink key, or None if missing or expired."""
+    doc = await shortlinks.find_one({'_id': key})
+    if doc and doc['expires_at'] > datetime.datetime.utcnow(): return doc
+    return None
+async def save_cached_shortlink(key, url, ttl):
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+    await shortlinks.update_one({'_id': key}, {'$set': {'url': url, 'expires_at': expires_at}}, upsert=True)
+
+# --- Files that arrived while their owner's ingestion quota was full, in arrival order ---
+async def add_overflow_file(owner_id, chat_id, message_id):
+    await ingest_overflow.insert_one({'owner_id': owner_id, 'chat_id': chat_id, 'message_id': message_id})
+async def get_overflow_files(owner_id, limit):
+    return await ingest_overflow.find({'owner_id': owner_id}).sort('_id', 1).limit(limit).to_list(length=limit)
+async def delete_overflow_files(ids):
+    await ingest_overflow.delete_many({'_id': {'$in': list(ids)}})
+async def count_overflow_files(owner_id):
+    return await ingest_overflow.count_documents({'owner_id': owner_id})
+async def get_overflow_owner_ids():
+    return await ingest_overflow.distinct('owner_id')
@@ -0,0 +1,151 @@
+import time
+import asyncio
+import logging
+from config import Config
+from database.db import (
+    get_title_groups, get_files_by_unique_ids, get_backup_job,
+    save_backup_job, get_running_backup_jobs
+)
+from utils.helpers import create_post, BatchFile, backfill_file_fields, go_back_button, cancel_markup, update_job_status
+from utils.grouping import group_titles
+from utils import cpu_pool
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_BACKUP_TASKS = {}
+# Progress messages are edited at most this often (seconds)
+PROGRESS_EDIT_INTERVAL = 5
+
+
+class _RateBudget:
+    """Spaces out posts from every running backup so that together they stay under `per_minute`."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0: await asyncio.sleep(wait)
+
+
+_budget = _RateBudget(Config.BACKUP_POSTS_PER_MINUTE)
+
+
+async def _update_status(client, owner_id, job, text, final=False):
+    markup = go_back_button(owner_id) if final else cancel_markup('backup', owner_id)
+    await update_job_status(client, owner_id, job, text, markup, save_backup_job)
+
+
+async def _build_plan(owner_id):
+    """
+    Groups the owner's files into posts. Mongo groups files by their stored title_key in a
+    single index-ordered pass; only the distinct keys are fuzzy-merged here. Keys arrive in
+    the order their first file was saved, which sets both the posting order and which title
+    leads each merged group. Files with no parsable title (empty title_key) are not part of
+    any group. Returns lists of file_unique_ids.
+    """
+    await backfill_file_fields(owner_id)
+    keys, members = [], []
+    async for group in get_title_groups(owner_id):
+        keys.append(group['_id'])
+        members.append(group['file_unique_ids'])
+
+    merged = await cpu_pool.run_cpu(group_titles, keys)
+    return [[uid for i in group for uid in members[i]] for group in merged]
+
+
+async def _post_batch(client, owner_id, channel_id, unique_ids):
+    docs = await get_files_by_unique_ids(owner_id, unique_ids)
+    if not docs: return
+    position = {uid: n for n, uid in enumerate(unique_ids)}
+    docs.sort(key=lambda d: position[d['file_unique_id']])
+    posts = await create_post(client, owner_id, [BatchFile.from_doc(d) for d in docs])
+    for post in posts:
+        await _budget.acquire()
+        await client._post_to_channel(channel_id, [post])
+
+
+async def _run_backup(client, owner_id):
+    job = await get_backup_job(owner_id)
+    try:
+        if job.get('plan') is None:
+            await _update_status(client, owner_id, job, "⏳ `Step 1/2:` Intelligently grouping your files by similarity...")
+            plan = await _build_plan(owner_id)
+            job.update({'plan': plan, 'next_batch': 0, 'total_batches': len(plan)})
+            await save_backup_job(owner_id, {'plan': plan, 'next_batch': 0, 'total_batches': len(plan)})
+
+        plan, total = job['plan'], job['total_batches']
+        if not plan:
+            await save_backup_job(owner_id, {'status': 'done'})
+            return await _update_status(client, owner_id, job, "You have no files to back up.", final=True)
+
+        last_edit = 0
+        for i in range(job['next_batch'], total):
+            try:
+                await _post_batch(client, owner_id, job['channel_id'], plan[i])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Failed to post batch during backup for user {owner_id}.")
+                await client.send_message(owner_id, f"Failed to back up a batch. Error: {e}")
+
+            # Checkpoint after every batch so a restart resumes right after the last posted one
+            job['next_batch'] = i + 1
+            await save_backup_job(owner_id, {'next_batch': i + 1})
+            if time.monotonic() - last_edit >= PROGRESS_EDIT_INTERVAL or i + 1 == total:
+                last_edit = time.monotonic()
+                await _update_status(client, owner_id, job, f"🔄 `Step 2/2:` Progress: {i + 1} / {total} batches processed.")
+
+        await save_backup_job(owner_id, {'status': 'done'})
+        await _update_status(client, owner_id, job, "✅ **Backup Complete!**", final=True)
+    except asyncio.CancelledError:
+        await save_backup_job(owner_id, {'status': 'cancelled'})
+        await _update_status(client, owner_id, job, "❌ Backup cancelled. Starting it again for the same channel resumes where it stopped.", final=True)
+        raise
+    except Exception as e:
+        logger.exception("Major error in backup process")
+        await save_backup_job(owner_id, {'status': 'failed', 'error': str(e)})
+        await _update_status(client, owner_id, job, f"A major error occurred: {e}\n\nStarting the backup again resumes where it stopped.", final=True)
+    finally:
+        ACTIVE_BACKUP_TASKS.pop(owner_id, None)
+
+
+async def start_backup(client, owner_id, channel_id, status_message_id=None):
+    """
+    Starts a backup of all the owner's files to channel_id. An unfinished backup to the
+    same channel is resumed from its last posted batch. Returns the batch it resumes from
+    (0 for a fresh backup), or None if a backup is already running.
+    """
+    if owner_id in ACTIVE_BACKUP_TASKS: return None
+    job = await get_backup_job(owner_id)
+    resume = job and job.get('channel_id') == channel_id and job.get('status') != 'done' and job.get('plan') is not None
+    if resume:
+        await save_backup_job(owner_id, {'status': 'running', 'status_message_id': status_message_id})
+    else:
+        await save_backup_job(owner_id, {
+            'channel_id': channel_id, 'status': 'running', 'plan': None,
+            'next_batch': 0, 'total_batches': 0, 'status_message_id': status_message_id
+        })
+    ACTIVE_BACKUP_TASKS[owner_id] = asyncio.create_task(_run_backup(client, owner_id))
+    return job['next_batch'] if resume else 0
+
+
+def cancel_backup(owner_id):
+    task = ACTIVE_BACKUP_TASKS.get(owner_id)
+    if not task: return False
+    task.cancel()
+    return True
+
+
+async def resume_backups(client):
+    """Restarts every backup that was running when the bot stopped."""
+    for job in await get_running_backup_jobs():
+        owner_id = job['_id']
+        if owner_id not in ACTIVE_BACKUP_TASKS:
+            logger.info(f"Resuming backup for user {owner_id} from batch {job.get('next_batch', 0)}.")
+            ACTIVE_BACKUP_TASKS[owner_id] = asyncio.create_task(_run_backup(client, owner_id))
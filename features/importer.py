@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from database.db import get_import_job, save_import_job, get_running_import_jobs, get_stored_unique_ids
+from utils.helpers import cancel_markup, update_job_status, GET_MESSAGES_LIMIT
+
+logger = logging.getLogger(__name__)
+
+IMPORT_PAGE_SIZE = GET_MESSAGES_LIMIT
+ACTIVE_IMPORTS = {}
+
+
+def _progress_text(job):
+    total = max(1, job['end_id'] - job['start_id'] + 1)
+    done = min(total, job['next_id'] - job['start_id'])
+    return (
+        "📥 **Importing Channel History**\n\n"
+        f"▫️ **Progress:** `{done}` / `{total}` messages ({done * 100 // total}%)\n"
+        f"▫️ **Imported:** `{job.get('imported', 0)}` files\n"
+        f"▫️ **Skipped (already saved):** `{job.get('skipped', 0)}` files\n\n"
+        "_New files you forward are always processed first._"
+    )
+
+
+async def _update_status(client, owner_id, job, final_text=None):
+    markup = None if final_text else cancel_markup('import', owner_id)
+    await update_job_status(client, owner_id, job, final_text or _progress_text(job), markup, save_import_job)
+
+
+def _is_importable(message):
+    if not message or message.empty or not message.media: return False
+    media = message.document or message.video or message.audio
+    return bool(media and media.file_name)
+
+
+async def _run_import(client, owner_id):
+    job = await get_import_job(owner_id)
+    channel_id = job['channel_id']
+    logger.info(f"Import for user {owner_id} running from message {job['next_id']} to {job['end_id']}.")
+    try:
+        while job['next_id'] <= job['end_id']:
+            ids = list(range(job['next_id'], min(job['next_id'] + IMPORT_PAGE_SIZE, job['end_id'] + 1)))
+            messages = await client.send_with_protection(client.get_messages, channel_id, ids)
+            media_messages = [m for m in messages if _is_importable(m)]
+
+            stored = await get_stored_unique_ids(owner_id, [(m.document or m.video or m.audio).file_unique_id for m in media_messages])
+            for m in media_messages:
+                if (m.document or m.video or m.audio).file_unique_id in stored:
+                    job['skipped'] = job.get('skipped', 0) + 1
+                    continue
+                await client.file_queue.put(owner_id, m, bulk=True)
+                job['imported'] = job.get('imported', 0) + 1
+
+            # Only checkpoint once the whole page is processed, so a restart never loses files
+            await client.file_queue.join(owner_id)
+            job['next_id'] = ids[-1] + 1
+            await save_import_job(owner_id, {'next_id': job['next_id'], 'imported': job.get('imported', 0), 'skipped': job.get('skipped', 0)})
+            await _update_status(client, owner_id, job)
+
+        await save_import_job(owner_id, {'status': 'done'})
+        await _update_status(client, owner_id, job, final_text=f"✅ **Import Complete!**\n\nImported `{job.get('imported', 0)}` files, skipped `{job.get('skipped', 0)}` already saved.")
+        logger.info(f"Import for user {owner_id} finished.")
+    except asyncio.CancelledError:
+        await save_import_job(owner_id, {'status': 'cancelled'})
+        await _update_status(client, owner_id, job, final_text="❌ Import cancelled. You can resume it later from the same menu.")
+        raise
+    except Exception as e:
+        logger.exception(f"Import for user {owner_id} failed.")
+        await save_import_job(owner_id, {'status': 'failed', 'error': str(e)})
+        await _update_status(client, owner_id, job, final_text=f"⚠️ Import stopped because of an error: `{e}`\n\nYou can resume it from the same menu.")
+    finally:
+        ACTIVE_IMPORTS.pop(owner_id, None)
+
+
+async def start_import(client, owner_id, channel_id, end_id):
+    """
+    Starts (or resumes) importing files from message 1 up to end_id of an owner's DB channel.
+    A previous unfinished job for the same channel continues from its checkpoint.
+    """
+    if owner_id in ACTIVE_IMPORTS: return False
+    job = await get_import_job(owner_id)
+    if job and job.get('channel_id') == channel_id and job.get('status') != 'done':
+        await save_import_job(owner_id, {'status': 'running', 'end_id': max(end_id, job['end_id'])})
+    else:
+        await save_import_job(owner_id, {
+            'channel_id': channel_id, 'start_id': 1, 'next_id': 1, 'end_id': end_id,
+            'imported': 0, 'skipped': 0, 'status': 'running', 'status_message_id': None
+        })
+    ACTIVE_IMPORTS[owner_id] = asyncio.create_task(_run_import(client, owner_id))
+    return True
+
+
+def cancel_import(owner_id):
+    task = ACTIVE_IMPORTS.get(owner_id)
+    if not task: return False
+    task.cancel()
+    return True
+
+
+async def resume_imports(client):
+    """Restarts every import that was running when the bot stopped."""
+    for job in await get_running_import_jobs():
+        owner_id = job['_id']
+        if owner_id not in ACTIVE_IMPORTS:
+            logger.info(f"Resuming import for user {owner_id} from message {job['next_id']}.")
+            ACTIVE_IMPORTS[owner_id] = asyncio.create_task(_run_import(client, owner_id))
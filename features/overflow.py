@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from database.db import (
+    add_overflow_file, get_overflow_files, delete_overflow_files, get_overflow_owner_ids
+)
+from utils.helpers import GET_MESSAGES_LIMIT
+
+logger = logging.getLogger(__name__)
+
+DRAIN_PAGE_SIZE = GET_MESSAGES_LIMIT
+ACTIVE_DRAINS = {}
+# Per owner: overflow inserts still in flight, and how many have been stored so far
+_SPILLS_IN_FLIGHT = {}
+_SPILLS_STORED = {}
+
+
+def is_spilling(owner_id):
+    """True while an owner has overflow files waiting; their new files must queue behind them."""
+    return owner_id in ACTIVE_DRAINS or owner_id in _SPILLS_IN_FLIGHT
+
+
+def _media(message):
+    if not message or message.empty or not message.media: return None
+    media = getattr(message, message.media.value, None)
+    return media if media and getattr(media, 'file_name', None) else None
+
+
+async def _drain(client, owner_id):
+    """Feeds an owner's overflow files back into the queue in arrival order, waiting for room as needed."""
+    try:
+        while True:
+            stored = _SPILLS_STORED.get(owner_id, 0)
+            records = await get_overflow_files(owner_id, DRAIN_PAGE_SIZE)
+            if not records:
+                # A spill stored while this read ran may have been missed, and it saw this drain
+                # running, so read again. Otherwise the break and the finally below run without
+                # yielding, and any later spill finds no drain and starts a new one.
+                if _SPILLS_STORED.get(owner_id, 0) != stored: continue
+                break
+            messages = {}
+            for chat_id in {r['chat_id'] for r in records}:
+                ids = [r['message_id'] for r in records if r['chat_id'] == chat_id]
+                for m in await client.send_with_protection(client.get_messages, chat_id, ids):
+                    if _media(m): messages[(chat_id, m.id)] = m
+            for r in records:
+                message = messages.get((r['chat_id'], r['message_id']))
+                # Messages deleted from the channel meanwhile are simply dropped
+                if message: await client.file_queue.put(owner_id, message)
+            await delete_overflow_files(r['_id'] for r in records)
+        logger.info(f"Overflow for user {owner_id} drained into the queue.")
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception(f"Draining overflow files for user {owner_id} failed; retrying on the next spilled file or restart.")
+    finally:
+        ACTIVE_DRAINS.pop(owner_id, None)
+
+
+def _ensure_drain(client, owner_id):
+    if owner_id not in ACTIVE_DRAINS:
+        ACTIVE_DRAINS[owner_id] = asyncio.create_task(_drain(client, owner_id))
+
+
+async def spill_file(client, owner_id, message):
+    """
+    Records a file whose owner is over quota and returns at once; a background task
+    queues it when room frees up. Only (chat_id, message_id) is stored.
+    """
+    _SPILLS_IN_FLIGHT[owner_id] = _SPILLS_IN_FLIGHT.get(owner_id, 0) + 1
+    try:
+        await add_overflow_file(owner_id, message.chat.id, message.id)
+        _SPILLS_STORED[owner_id] = _SPILLS_STORED.get(owner_id, 0) + 1
+    finally:
+        remaining = _SPILLS_IN_FLIGHT.pop(owner_id) - 1
+        if remaining: _SPILLS_IN_FLIGHT[owner_id] = remaining
+    _ensure_drain(client, owner_id)
+
+
+async def resume_overflow(client):
+    """Restarts draining for every owner whose overflow files were left when the bot stopped."""
+    for owner_id in await get_overflow_owner_ids():
+        logger.info(f"Resuming overflow drain for user {owner_id}.")
+        _ensure_drain(client, owner_id)
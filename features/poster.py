@@ -1,12 +1,22 @@
 import asyncio
-import aiohttp
 from bs4 import BeautifulSoup
 import logging
 import re
+import datetime
 from config import Config
+from database.db import get_cached_poster, save_cached_poster
+from utils import http_client
+from utils.lru_cache import LRUCache
+from features.poster_index import normalize_title, lookup_poster, fuzzy_lookup_poster, is_loaded as poster_index_loaded
 
 logger = logging.getLogger(__name__)
 
+# In-process LRU in front of the Mongo cache: key -> poster url, or None for a title with no poster
+_poster_lru = LRUCache(Config.POSTER_CACHE_SIZE)
+_MISSING = object()
+# Lookups in progress, keyed like the cache, shared by prefetches and get_poster() callers
+_inflight = {}
+
 def generate_search_queries(title: str):
     """Generates a list of progressively shorter search queries from a title."""
     words = title.split()
@@ -17,73 +27,177 @@ def generate_search_queries(title: str):
             queries.append(' '.join(words[:i]))
     return list(dict.fromkeys(queries)) # Return unique queries
 
+class PosterSearchFailed(Exception):
+    """Nothing was found, but some sources could not be asked, so the title may still have a poster."""
+
+IMDB_HEADERS = {'User-Agent': 'Mozilla/5.0', 'Accept-Language': 'en-US,en;q=0.5'}
+
 async def _find_poster_from_imdb(query: str):
-    """Internal function to get the best-guess poster from IMDb for a single query."""
-    try:
-        search_url = f"https://www.imdb.com/find?q={re.sub(r'\s+', '+', query)}"
-        headers = {'User-Agent': 'Mozilla/5.0', 'Accept-Language': 'en-US,en;q=0.5'}
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(search_url, timeout=10) as resp:
-                if resp.status != 200: return None
-                soup = BeautifulSoup(await resp.text(), 'html.parser')
-                result_link = soup.select_one("a.ipc-metadata-list-summary-item__t")
-                if not result_link or not result_link.get('href'): return None
-                
-                movie_url = "https://www.imdb.com" + result_link['href'].split('?')[0]
-                async with session.get(movie_url, timeout=10) as movie_resp:
-                    if movie_resp.status != 200: return None
-                    movie_soup = BeautifulSoup(await movie_resp.text(), 'html.parser')
-                    img_tag = movie_soup.select_one('div[data-testid="hero-media__poster"] img.ipc-image')
-                    if img_tag and img_tag.get('src'):
-                        poster_url = img_tag['src'].split('_V1_')[0] + "_V1_FMjpg_UX1000_.jpg"
-                        return poster_url
-    except Exception:
-        return None
+    """
+    Internal function to get the best-guess poster from IMDb for a single query.
+    Returns None when IMDb has no poster; network errors are raised, so they are never taken for a miss.
+    """
+    search_query = re.sub(r'\s+', '+', query)
+    search_url = f"https://www.imdb.com/find?q={search_query}"
+    html = await http_client.get_text(search_url, headers=IMDB_HEADERS)
+    if not html: return None
+    soup = BeautifulSoup(html, 'html.parser')
+    result_link = soup.select_one("a.ipc-metadata-list-summary-item__t")
+    if not result_link or not result_link.get('href'): return None
+
+    movie_url = "https://www.imdb.com" + result_link['href'].split('?')[0]
+    movie_html = await http_client.get_text(movie_url, headers=IMDB_HEADERS)
+    if not movie_html: return None
+    movie_soup = BeautifulSoup(movie_html, 'html.parser')
+    img_tag = movie_soup.select_one('div[data-testid="hero-media__poster"] img.ipc-image')
+    if img_tag and img_tag.get('src'):
+        poster_url = img_tag['src'].split('_V1_')[0] + "_V1_FMjpg_UX1000_.jpg"
+        return poster_url
     return None
 
 async def _find_poster_from_tmdb(query: str, year: str = None):
-    """Internal function to get the best-guess poster from TMDB for a single query."""
+    """Internal function to get the best-guess poster from TMDB for a single query. Raises on network errors."""
     if not Config.TMDB_API_KEY: return None
-    try:
-        search_url = "https://api.themoviedb.org/3/search/multi"
-        params = {"api_key": Config.TMDB_API_KEY, "query": query, "include_adult": "false"}
-        if year: params['year'] = year
-        async with aiohttp.ClientSession() as session:
-            async with session.get(search_url, params=params, timeout=10) as resp:
-                if resp.status != 200: return None
-                data = await resp.json()
-                if data.get('results') and data['results'][0].get("poster_path"):
-                    return f"https://image.tmdb.org/t/p/w500{data['results'][0]['poster_path']}"
-    except Exception:
-        return None
+    search_url = "https://api.themoviedb.org/3/search/multi"
+    params = {"api_key": Config.TMDB_API_KEY, "query": query, "include_adult": "false"}
+    if year: params['year'] = year
+    data = await http_client.get_json(search_url, params=params)
+    if data and data.get('results') and data['results'][0].get("poster_path"):
+        return f"https://image.tmdb.org/t/p/w500{data['results'][0]['poster_path']}"
     return None
 
+def poster_cache_key(query: str, year: str = None) -> str:
+    """Normalized (title, year) key, so spelling variants of the same title share one entry."""
+    return f"{normalize_title(query)}|{year or ''}"
+
+def _remember(key, url, ttl):
+    _poster_lru.set(key, url, ttl)
+
+def _cached(key):
+    """(True, url) for a fresh LRU entry, otherwise (False, None)."""
+    cached = _poster_lru.get(key, _MISSING)
+    return (False, None) if cached is _MISSING else (True, cached)
+
+async def _resolve_poster(key, query, year):
+    try:
+        doc = await get_cached_poster(key)
+    except Exception as e:
+        logger.warning(f"Poster cache lookup failed for '{key}': {e}"); doc = None
+    if doc:
+        ttl = (doc['expires_at'] - datetime.datetime.utcnow()).total_seconds()
+        _remember(key, doc['url'], ttl)
+        return doc['url']
+
+    # Close spellings in the local index; scoring is CPU work, so it stays off the event loop
+    poster = await asyncio.to_thread(fuzzy_lookup_poster, query, year) if poster_index_loaded() else None
+    if not poster:
+        try:
+            poster = await _search_poster(query, year)
+        except asyncio.TimeoutError:
+            return None  # Not cached: a slow search says nothing about whether a poster exists
+        except PosterSearchFailed as e:
+            logger.warning(f"Poster search for '{query}' incomplete; not caching the miss: {e}"); return None
+        except Exception:
+            logger.exception(f"Poster search failed for '{query}'."); return None
+    ttl = Config.POSTER_CACHE_TTL if poster else Config.POSTER_NEGATIVE_TTL
+    _remember(key, poster, ttl)
+    try:
+        await save_cached_poster(key, poster, ttl)
+    except Exception as e:
+        logger.warning(f"Could not cache poster for '{key}': {e}")
+    return poster
+
+def _lookup_task(key, query, year):
+    """The running lookup for a key, started if there is none, so concurrent callers share one search."""
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.create_task(_resolve_poster(key, query, year))
+        task.add_done_callback(lambda t: _inflight.pop(key, None) if _inflight.get(key) is t else None)
+    return task
+
+def _from_local_index(key, query, year):
+    poster = lookup_poster(query, year)
+    if poster: _remember(key, poster, Config.POSTER_CACHE_TTL)
+    return poster
+
+def prefetch_poster(query: str, year: str = None):
+    """Starts resolving a poster in the background so that a later get_poster() finds it ready or in flight."""
+    key = poster_cache_key(query, year)
+    if not _cached(key)[0] and not _from_local_index(key, query, year): _lookup_task(key, query, year)
+
+def cancel_poster_lookups():
+    for task in list(_inflight.values()): task.cancel()
+
 async def get_poster(query: str, year: str = None):
     """
-    The definitive 'waterfall' poster finder. It tries every possible combination
-    of truncated queries and sources until it gets a match.
+    Returns the poster URL for a title, or None. Answers come from the in-process LRU,
+    an exact match in the local poster index, a lookup already in flight, the Mongo
+    cache, a fuzzy match in the local index, and only then from a network search.
+    Misses are cached too.
     """
-    search_queries = generate_search_queries(query)
-    logger.info(f"Waterfall Search: Starting for '{query}'. Queries: {search_queries}")
+    key = poster_cache_key(query, year)
+    hit, url = _cached(key)
+    if hit: return url
+    url = _from_local_index(key, query, year)
+    if url: return url
+    # Shielded: a cancelled caller must not cancel a lookup other callers are waiting on
+    return await asyncio.shield(_lookup_task(key, query, year))
 
-    for sq in search_queries:
-        logger.info(f"Waterfall Search: Trying query '{sq}'...")
-        
+def _candidates(query: str, year: str = None):
+    """Every (label, lookup) to try, in the waterfall's priority order."""
+    candidates = []
+    for sq in generate_search_queries(query):
         # --- IMDb First (User Preference) ---
-        if year:
-            poster = await _find_poster_from_imdb(f"{sq} {year}")
-            if poster: logger.info(f"SUCCESS: IMDb with year for '{sq}'"); return poster
-        
-        poster = await _find_poster_from_imdb(sq)
-        if poster: logger.info(f"SUCCESS: IMDb without year for '{sq}'"); return poster
-        
+        if year: candidates.append((f"IMDb with year for '{sq}'", _find_poster_from_imdb, (f"{sq} {year}",)))
+        candidates.append((f"IMDb without year for '{sq}'", _find_poster_from_imdb, (sq,)))
         # --- TMDB Second (API Fallback) ---
-        if year:
-            poster = await _find_poster_from_tmdb(sq, year)
-            if poster: logger.info(f"SUCCESS: TMDB with year for '{sq}'"); return poster
-        
-        poster = await _find_poster_from_tmdb(sq)
-        if poster: logger.info(f"SUCCESS: TMDB without year for '{sq}'"); return poster
-
-    logger.error(f"Waterfall Search: All attempts failed for base query '{query}'.")
-    return None
+        if year: candidates.append((f"TMDB with year for '{sq}'", _find_poster_from_tmdb, (sq, year)))
+        candidates.append((f"TMDB without year for '{sq}'", _find_poster_from_tmdb, (sq,)))
+    return candidates
+
+async def _search_poster(query: str, year: str = None):
+    """
+    Hedged version of the 'waterfall' poster finder. All query/source combinations are
+    launched together (at most POSTER_LOOKUP_CONCURRENCY at a time) and the result of the
+    highest-priority one that finds a poster wins; lower-priority lookups are then cancelled.
+    Returns None only if every lookup answered without a poster. Raises asyncio.TimeoutError
+    if nothing was found within POSTER_LOOKUP_DEADLINE, and PosterSearchFailed if nothing was
+    found and at least one lookup failed.
+    """
+    candidates = _candidates(query, year)
+    logger.info(f"Poster Search: Starting for '{query}' with {len(candidates)} candidate lookups.")
+    semaphore = asyncio.Semaphore(Config.POSTER_LOOKUP_CONCURRENCY)
+
+    async def lookup(func, args):
+        async with semaphore:
+            return await func(*args)
+
+    tasks = [asyncio.create_task(lookup(func, args)) for _, func, args in candidates]
+
+    async def first_in_priority_order():
+        errors = []
+        for (label, _, _), task in zip(candidates, tasks):
+            try:
+                poster = await task
+            except Exception as e:
+                errors.append(e); continue
+            if poster: logger.info(f"SUCCESS: {label}"); return poster
+        if errors: raise PosterSearchFailed(f"{len(errors)} of {len(tasks)} lookups failed, last: {errors[-1]!r}")
+        return None
+
+    try:
+        poster = await asyncio.wait_for(first_in_priority_order(), Config.POSTER_LOOKUP_DEADLINE)
+        if not poster: logger.error(f"Poster Search: All attempts failed for base query '{query}'.")
+        return poster
+    except asyncio.TimeoutError:
+        # Out of time: settle for the best-ranked lookup that has already found something
+        for (label, _, _), task in zip(candidates, tasks):
+            if task.done() and not task.cancelled() and not task.exception() and task.result():
+                logger.info(f"SUCCESS (deadline): {label}"); return task.result()
+        logger.warning(f"Poster Search: No poster for '{query}' within {Config.POSTER_LOOKUP_DEADLINE}s.")
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+            # Failures of lookups nobody awaited are retrieved here, so asyncio does not log them
+            if task.done() and not task.cancelled(): task.exception()
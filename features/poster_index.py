@@ -0,0 +1,124 @@
+# poster_index.py
+# Optional offline title -> poster index, loaded from a dataset dump (Config.POSTER_INDEX_PATH).
+#
+# Supported formats (optionally gzipped):
+#   .tsv          header row with at least: title, year, poster
+#   .json         a list of {"title", "year", "poster"} objects
+#   .jsonl        one such object per line
+# "poster" may be a full URL or a TMDB poster path such as "/abc123.jpg".
+
+import re
+import csv
+import math
+import bisect
+import gzip
+import json
+import time
+import logging
+from rapidfuzz import fuzz, process
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+TMDB_IMAGE_BASE = "https://image.tmdb.org/t/p/w500"
+
+# normalized title -> [(year or None, poster url)], and block key -> (title lengths, titles) sorted
+# by length, so a fuzzy lookup only scores titles whose length can reach the cutoff
+_titles = {}
+_blocks = {}
+# Leading articles are skipped when blocking; otherwise "the" alone would be a huge block
+_ARTICLES = {'the', 'a', 'an'}
+
+
+def normalize_title(title: str) -> str:
+    """Lower-cased title with punctuation folded to spaces and whitespace collapsed."""
+    return " ".join(re.sub(r'[^\w\s]', ' ', (title or '').lower()).split())
+
+
+def _block_key(key):
+    """First three letters of the title's first word that is not an article."""
+    words = key.split()
+    while len(words) > 1 and words[0] in _ARTICLES: words = words[1:]
+    return words[0][:3]
+
+
+def _open(path):
+    return gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, encoding='utf-8')
+
+
+def _read_rows(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    with _open(path) as f:
+        if name.endswith('.tsv'):
+            yield from csv.DictReader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        elif name.endswith('.jsonl'):
+            for line in f:
+                if line.strip(): yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def load_poster_index(path):
+    """Builds the index from a dump. Blocking; run it in a thread. Returns the number of titles."""
+    global _titles, _blocks
+    started = time.perf_counter()
+    titles, blocks = {}, {}
+    for row in _read_rows(path):
+        key, poster = normalize_title(row.get('title')), (row.get('poster') or '').strip()
+        if not key or not poster: continue
+        if poster.startswith('/'): poster = TMDB_IMAGE_BASE + poster
+        year = str(row.get('year') or '').strip() or None
+        if key not in titles: blocks.setdefault(_block_key(key), []).append(key)
+        titles.setdefault(key, []).append((year, poster))
+    for prefix, keys in blocks.items():
+        keys.sort(key=len)
+        blocks[prefix] = ([len(k) for k in keys], keys)
+    # Swap in whole so lookups never see a half-built index
+    _titles, _blocks = titles, blocks
+    logger.info(f"Poster index loaded: {len(titles)} titles from {path} in {time.perf_counter() - started:.1f}s.")
+    return len(titles)
+
+
+def _pick(entries, year):
+    if not year: return entries[0][1]
+    for entry_year, poster in entries:
+        if entry_year == year: return poster
+    # Release years in filenames are often off by one (festival vs. theatrical release)
+    for entry_year, poster in entries:
+        if entry_year and entry_year.isdigit() and year.isdigit() and abs(int(entry_year) - int(year)) <= 1: return poster
+    return None
+
+
+def is_loaded():
+    return bool(_titles)
+
+
+def lookup_poster(title: str, year: str = None):
+    """Poster URL for an exact normalized title match in the local index, or None. Cheap enough for the event loop."""
+    if not _titles: return None
+    entries = _titles.get(normalize_title(title))
+    return _pick(entries, year) if entries else None
+
+
+def fuzzy_lookup_poster(title: str, year: str = None):
+    """
+    Poster URL for the closest title in the same block (see _block_key), or None. Blocking;
+    run it in a thread. Only titles whose length can still reach the cutoff are scored,
+    at most POSTER_INDEX_FUZZY_LIMIT of them, nearest in length first.
+    """
+    if not _titles: return None
+    key = normalize_title(title)
+    if not key: return None
+    block = _blocks.get(_block_key(key))
+    if not block: return None
+    lengths, keys = block
+    # fuzz.ratio is 200 * matches / (len(a) + len(b)), so it needs lengths within this window
+    cutoff = Config.POSTER_INDEX_FUZZY_CUTOFF
+    lo = bisect.bisect_left(lengths, math.ceil(len(key) * cutoff / (200 - cutoff)))
+    hi = bisect.bisect_right(lengths, math.floor(len(key) * (200 - cutoff) / cutoff))
+    if hi - lo > Config.POSTER_INDEX_FUZZY_LIMIT:
+        mid = bisect.bisect_left(lengths, len(key), lo, hi)
+        lo = max(lo, mid - Config.POSTER_INDEX_FUZZY_LIMIT // 2)
+        hi = min(hi, lo + Config.POSTER_INDEX_FUZZY_LIMIT)
+    match = process.extractOne(key, keys[lo:hi], scorer=fuzz.ratio, score_cutoff=cutoff)
+    return _pick(_titles[match[0]], year) if match else None
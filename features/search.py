@@ -0,0 +1,59 @@
+import logging
+from rapidfuzz import fuzz
+from config import Config
+from database.db import find_files_with_all_tokens, find_files_with_any_token
+from utils.filename_parser import search_words, episode_tokens, SEARCH_TOKEN_MAX
+from utils.helpers import get_file_meta
+
+logger = logging.getLogger(__name__)
+
+# Prefix length used to gather candidates for the fuzzy fallback
+FUZZY_PREFIX = 3
+
+
+def _rank(doc, phrase, words):
+    """Relevance of a token match: exact or leading title match, whole-word hits, year and episode tags."""
+    meta = get_file_meta(doc)
+    title = " ".join(search_words(meta.title))
+    score = 0
+    if title == phrase: score += 100
+    elif title.startswith(phrase): score += 50
+    title_words = set(title.split())
+    score += 10 * sum(1 for word in words if word in title_words)
+    if meta.year and str(meta.year) in words: score += 15
+    if episode_tokens(meta) & set(words): score += 15
+    return score
+
+
+async def search_files(owner_id, query: str):
+    """
+    Searches an owner's files. Every query word must prefix-match an indexed token of the
+    file (title words, year, resolution, season/episode); matches are ranked by relevance,
+    newest first among equals. If nothing matches, falls back to fuzzy title matching so
+    typos still find something. Returns (ranked file _ids, capped), where capped means
+    more than SEARCH_RESULT_LIMIT files matched and only the first ones are returned.
+    """
+    words = [word[:SEARCH_TOKEN_MAX] for word in search_words(query)]
+    if not words: return [], False
+    phrase = " ".join(words)
+    limit = Config.SEARCH_RESULT_LIMIT
+
+    # One-letter words are only indexed as whole words, so they are required only when nothing longer is given
+    required = {word for word in words if len(word) >= 2} or set(words)
+    docs = await find_files_with_all_tokens(owner_id, required, limit + 1)
+    if docs:
+        capped = len(docs) > limit
+        ranked = sorted(docs[:limit], key=lambda doc: (_rank(doc, phrase, words), doc['_id']), reverse=True)
+        return [doc['_id'] for doc in ranked], capped
+
+    # Fuzzy fallback: gather files sharing a short prefix with any query word, then score titles
+    prefixes = {word[:FUZZY_PREFIX] for word in words if len(word) >= 2}
+    if not prefixes: return [], False
+    candidates = await find_files_with_any_token(owner_id, prefixes, Config.SEARCH_FUZZY_CANDIDATES)
+    scored = []
+    for doc in candidates:
+        score = fuzz.WRatio(phrase, " ".join(search_words(get_file_meta(doc).title)))
+        if score >= Config.SEARCH_FUZZY_CUTOFF: scored.append((score, doc['_id']))
+    scored.sort(reverse=True)
+    logger.info(f"Search '{query}' for owner {owner_id}: no token match, {len(scored)} fuzzy matches.")
+    return [file_id for _, file_id in scored[:limit]], len(scored) > limit
@@ -1,42 +1,126 @@
-import aiohttp
+import time
 import asyncio
+import datetime
+import hashlib
 import logging
-from database.db import get_user
+from config import Config
+from database.db import get_user, get_cached_shortlink, save_cached_shortlink
+from utils import http_client
+from utils.circuit_breaker import get_breaker
+from utils.lru_cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
-async def get_shortlink(link_to_shorten, user_id):
+# In-process LRU in front of the Mongo shortlink cache: key -> shortened url
+_shortlink_lru = LRUCache(Config.SHORTLINK_CACHE_SIZE, Config.SHORTLINK_CACHE_TTL)
+_pregen_semaphore = None
+
+
+def delivery_link(bot_username, owner_id, file_unique_id):
+    """The deep link that finally delivers a file; this is what gets shortened."""
+    return f"https://t.me/{bot_username}?start=finalget_{owner_id}_{file_unique_id}"
+
+
+def _cache_key(user_id, domain, api, link):
+    # The API key decides whose shortener account earns from the link, so it is part of the key
+    api_tag = hashlib.sha1(api.encode()).hexdigest()[:8]
+    return f"{user_id}|{domain}|{api_tag}|{link}"
+
+
+async def _shorten(domain, api, link_to_shorten, user_id):
+    """
+    Calls the shortener API within SHORTENER_DEADLINE. Each domain has its own circuit
+    breaker, so a dead shortener is skipped immediately instead of timing out every click.
+    Only transport errors, timeouts, 429 and 5xx count towards opening it; a 4xx or an API
+    error concerns one owner's request and must not cut off the other owners.
+    """
+    breaker = get_breaker(domain)
+    if not breaker.allow():
+        logger.warning(f"Shortener {domain} is unavailable (circuit open); skipping for user {user_id}.")
+        return None
+    started = time.monotonic()
+    try:
+        # Transport errors, timeouts and 5xx responses are retried by the shared HTTP client
+        data = await asyncio.wait_for(
+            http_client.get_json(f'https://{domain}/api', params={'api': api, 'url': link_to_shorten}, ssl=False, raise_for_status=True),
+            Config.SHORTENER_DEADLINE
+        )
+    except asyncio.CancelledError:
+        breaker.abandon(); raise
+    except http_client.HTTPStatusError as e:
+        # A 4xx is about this owner's request (e.g. a revoked API key), not the shortener's health
+        breaker.record_api_error(time.monotonic() - started, e)
+        logger.error(f"Shortener {domain} rejected the request for user {user_id}: {e}")
+        return None
+    except Exception as e:
+        breaker.record_failure(time.monotonic() - started, e)
+        logger.error(f"HTTP Error during shortening for user {user_id}: {e!r}")
+        return None
+
+    latency = time.monotonic() - started
+    if isinstance(data, dict) and data.get("status") == "success" and data.get("shortenedUrl"):
+        breaker.record_success(latency)
+        return data["shortenedUrl"]
+    message = data.get('message', 'Unknown error') if isinstance(data, dict) else 'Unexpected response'
+    breaker.record_api_error(latency, message)
+    logger.error(f"Shortener API error for user {user_id}: {message}")
+    return None
+
+
+async def get_shortlink(link_to_shorten, user_id, user=None):
     """
-    Shortens the provided link using the user's settings.
-    Now includes a retry mechanism for better reliability.
+    Shortens the provided link using the user's settings. Results are cached per owner,
+    shortener and link, so repeat requests for a file never wait on the shortener API.
+    Pass the owner's settings as `user` when they are already loaded.
     """
-    user = await get_user(user_id)
+    user = user or await get_user(user_id)
     if not user or not user.get('shortener_enabled') or not user.get('shortener_url'):
         return link_to_shorten
 
     URL = user['shortener_url'].strip()
-    API = user['shortener_api'].strip()
-
-    # Retry logic: Attempt the API call up to 3 times
-    for attempt in range(3):
-        try:
-            url = f'https://{URL}/api'
-            params = {'api': API, 'url': link_to_shorten}
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, raise_for_status=True, ssl=False, timeout=10) as response:
-                    data = await response.json(content_type=None)
-                    if data.get("status") == "success" and data.get("shortenedUrl"):
-                        return data["shortenedUrl"]  # Success, return the link and exit the loop
-                    else:
-                        logger.error(f"Shortener API error (Attempt {attempt + 1}/3): {data.get('message', 'Unknown error')}")
-        except Exception as e:
-            logger.error(f"HTTP Error during shortening (Attempt {attempt + 1}/3): {e}")
-        
-        # If not the last attempt, wait for 1 second before retrying
-        if attempt < 2:
-            await asyncio.sleep(1)
-
-    # If all attempts fail, log it and return the original link as a fallback
-    logger.error(f"All shortener attempts failed for user {user_id}. Returning original link.")
-    return link_to_shorten
+    API = (user.get('shortener_api') or '').strip()
+    key = _cache_key(user_id, URL, API, link_to_shorten)
+
+    cached = _shortlink_lru.get(key)
+    if cached: return cached
+    doc = None
+    try:
+        doc = await get_cached_shortlink(key)
+    except Exception as e:
+        logger.warning(f"Shortlink cache lookup failed for user {user_id}: {e}")
+    if doc:
+        # Only for as long as Mongo would still serve it
+        _shortlink_lru.set(key, doc['url'], (doc['expires_at'] - datetime.datetime.utcnow()).total_seconds())
+        return doc['url']
+
+    shortened = await _shorten(URL, API, link_to_shorten, user_id)
+    if not shortened:
+        # If shortening fails, return the original link as a fallback
+        logger.error(f"Shortening failed for user {user_id}. Returning original link.")
+        return link_to_shorten
+
+    _shortlink_lru.set(key, shortened)
+    try:
+        await save_cached_shortlink(key, shortened, Config.SHORTLINK_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Could not cache shortlink for user {user_id}: {e}")
+    return shortened
+
+
+async def pregenerate_shortlinks(bot_username, owner_id, user, file_unique_ids):
+    """
+    Shortens the delivery links of freshly posted files in the background, so the first
+    user to click one already finds it cached. Bounded by SHORTLINK_PREGEN_CONCURRENCY.
+    """
+    global _pregen_semaphore
+    if not user or not user.get('shortener_enabled') or not user.get('shortener_url'): return
+    if _pregen_semaphore is None: _pregen_semaphore = asyncio.Semaphore(Config.SHORTLINK_PREGEN_CONCURRENCY)
+
+    async def pregenerate(file_unique_id):
+        async with _pregen_semaphore:
+            await get_shortlink(delivery_link(bot_username, owner_id, file_unique_id), owner_id, user)
+
+    try:
+        await asyncio.gather(*(pregenerate(uid) for uid in file_unique_ids))
+    except Exception as e:
+        logger.warning(f"Shortlink pre-generation failed for user {owner_id}: {e}")
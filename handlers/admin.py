@@ -6,10 +6,13 @@ from config import Config
 from database.db import (
     total_users_count, get_all_user_ids, get_storage_owners_count,
     get_storage_owner_ids, get_normal_user_ids, delete_all_files,
-    set_owner_db_channel, set_stream_channel  # <-- Import set_stream_channel
+    set_owner_db_channel, set_stream_channel,  # <-- Import set_stream_channel
+    get_index_report, get_user_cache_stats
 )
 from features.broadcaster import broadcast_message
 from utils.helpers import go_back_button
+from utils import tracing
+from utils.circuit_breaker import get_all_breakers
 
 logger = logging.getLogger(__name__)
 
@@ -136,3 +139,80 @@ async def reset_db_confirm(client, query):
     await query.message.edit_text("⚙️ Resetting files database... Please wait.")
     deleted_count = await delete_all_files()
     await query.message.edit_text(f"✅ **Success!**\n\nDeleted **{deleted_count}** file entries from the database.")
+
+@Client.on_message(filters.command("batches") & filters.user(Config.ADMIN_ID))
+async def open_batches_handler(client, message):
+    batches = client.batch_scheduler.snapshot()
+    if not batches:
+        return await message.reply_text("📦 **Open Batches**\n\nNo batches are open right now.")
+    text = f"📦 **Open Batches ({len(batches)})**\n\n"
+    for b in batches[:30]:
+        text += f"`{b['user_id']}` • **{b['batch_key']}**\n    Files: `{b['files']}` | Age: `{b['age']:.0f}s` | Closes in: `{b['closes_in']:.0f}s`\n"
+    if len(batches) > 30:
+        text += f"\n_...and {len(batches) - 30} more._"
+    await message.reply_text(text)
+
+@Client.on_message(filters.command("latency") & filters.user(Config.ADMIN_ID))
+async def latency_handler(client, message):
+    histograms = tracing.get_histograms()
+    if not histograms:
+        return await message.reply_text("⏱️ **Pipeline Latency**\n\nNo measurements yet.")
+    text = "⏱️ **Pipeline Latency** _(seconds)_\n\n"
+    for stage, h in sorted(histograms.items(), key=lambda item: -item[1]['avg'] * item[1]['count']):
+        text += f"**{stage}** — n=`{h['count']}` avg=`{h['avg']:.2f}` p50≤`{h['p50']:g}` p95≤`{h['p95']:g}` max=`{h['max']:.2f}`\n"
+    text += "\n_Sorted by total time spent. Use /timeline [owner_id] for per-batch breakdowns._"
+    await message.reply_text(text)
+
+@Client.on_message(filters.command("timeline") & filters.user(Config.ADMIN_ID))
+async def timeline_handler(client, message):
+    owner_id = int(message.command[1]) if len(message.command) > 1 and message.command[1].lstrip("-").isdigit() else None
+    timelines = tracing.get_timelines(owner_id, limit=3)
+    if not timelines:
+        return await message.reply_text("🧭 **Batch Timelines**\n\nNo finished batches recorded yet.")
+    text = "🧭 **Batch Timelines** _(offsets from batch open, seconds)_\n"
+    for t in timelines:
+        # The first file's own spans start before the batch opened, so measure from the earliest one
+        total = t['closed_at'] - t['opened_at'] - min(0.0, *(agg[3] for agg in t['stages'].values()))
+        text += f"\n**{t['batch_key']}** • owner `{t['owner_id']}` • total `{total:.1f}s`\n"
+        for stage, (count, spent, longest, first, last) in sorted(t['stages'].items(), key=lambda item: item[1][3]):
+            text += f"  `{stage}` ×{count}: `{spent:.2f}s` (max `{longest:.2f}`) at `{first:+.1f}`→`{last:+.1f}`\n"
+    await message.reply_text(text)
+
+@Client.on_message(filters.command("shorteners") & filters.user(Config.ADMIN_ID))
+async def shorteners_handler(client, message):
+    breakers = get_all_breakers()
+    if not breakers:
+        return await message.reply_text("🔗 **Shortener Health**\n\nNo shortener calls made yet.")
+    text = "🔗 **Shortener Health**\n"
+    for domain, breaker in sorted(breakers.items(), key=lambda item: -item[1].stats['calls']):
+        s = breaker.stats
+        success_rate = s['successes'] / s['calls'] * 100 if s['calls'] else 0.0
+        text += (f"\n**{domain}** — `{breaker.state}`\n"
+                 f"  calls `{s['calls']}` • ok `{success_rate:.0f}%` • failed `{s['failures']}` • API errors `{s['api_errors']}` • skipped `{s['rejected']}`\n"
+                 f"  latency avg `{s['avg_latency']:.2f}s` max `{s['max_latency']:.2f}s`\n")
+        if s['last_error']: text += f"  last error: `{s['last_error'][:100]}`\n"
+    await message.reply_text(text)
+
+@Client.on_message(filters.command("indexes") & filters.user(Config.ADMIN_ID))
+async def indexes_handler(client, message):
+    try:
+        report = await get_index_report()
+    except Exception as e:
+        return await message.reply_text(f"Could not read index statistics: `{e}`")
+    text = "🗂️ **Database Indexes**\n"
+    for name, r in report.items():
+        text += f"\n**{name}** — {r['total']} indexes\n"
+        for keys in r['missing']: text += f"  ⚠️ missing: `{', '.join(f'{k} {d}' for k, d in keys)}`\n"
+        for index_name in r['unused']: text += f"  💤 unused since server start: `{index_name}`\n"
+    text += "\n_Missing indexes are created on the next bot start._"
+    await message.reply_text(text)
+
+@Client.on_message(filters.command("usercache") & filters.user(Config.ADMIN_ID))
+async def user_cache_handler(client, message):
+    s = get_user_cache_stats()
+    await message.reply_text(
+        "👤 **User Settings Cache**\n\n"
+        f"Hit rate: `{s['hit_rate'] * 100:.1f}%` (`{s['hits']}` hits / `{s['misses']}` misses)\n"
+        f"Invalidations: `{s['invalidations']}`\n"
+        f"Cached users: `{s['size']}` / `{Config.USER_CACHE_SIZE}`"
+    )
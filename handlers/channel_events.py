@@ -0,0 +1,19 @@
+import logging
+from pyrogram import Client
+from utils.channel_cache import invalidate_channel
+
+logger = logging.getLogger(__name__)
+
+
+@Client.on_chat_member_updated()
+async def bot_membership_handler(client, update):
+    """
+    Drops the cached channel info whenever the bot's own membership or rights
+    change in a chat, so the next check reflects the new state.
+    """
+    try:
+        member = update.new_chat_member or update.old_chat_member
+        if member and member.user and member.user.is_self:
+            invalidate_channel(update.chat.id)
+    except Exception:
+        logger.exception("Error in bot_membership_handler")
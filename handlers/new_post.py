@@ -1,14 +1,43 @@
+import asyncio
 import logging
 from pyrogram import Client, filters
-from database.db import find_owner_by_db_channel
+from database.db import find_owner_by_db_channel, count_overflow_files
+from features.overflow import is_spilling, spill_file
 
 logger = logging.getLogger(__name__)
 
+async def _send_queue_notice(client, user_id):
+    """Tells an owner that their files are waiting in the queue. Sent at most once every 2 minutes."""
+    flag_key = f"queue_{user_id}"
+    if client.notification_flags.get(flag_key): return
+    client.notification_flags[flag_key] = True
+    asyncio.get_running_loop().call_later(120, client._reset_notification_flag, flag_key)
+
+    queue = client.file_queue
+    try:
+        overflow = await count_overflow_files(user_id)
+    except Exception:
+        overflow = 0
+    eta = queue.eta(user_id, extra=overflow)
+    eta_text = f"~{max(1, round(eta / 60))} min" if eta is not None else "calculating..."
+    text = (
+        "⏳ **Your files are queued**\n\n"
+        "You are sending files faster than they can be processed, so new files are waiting their turn. "
+        "Nothing is lost — every file will be saved and posted.\n\n"
+        f"▫️ **Pending:** `{queue.pending(user_id) + overflow}` files\n"
+        f"▫️ **Position:** `{queue.position(user_id) + overflow}` in queue\n"
+        f"▫️ **ETA:** `{eta_text}`"
+    )
+    try:
+        await client.send_message(user_id, text)
+    except Exception as e:
+        logger.warning(f"Could not send queue notice to user {user_id}: {e}")
+
 @Client.on_message(filters.channel & (filters.document | filters.video | filters.audio), group=2)
 async def new_file_handler(client, message):
     """
     This handler listens for new files, finds the owner, and adds the file
-    to the processing queue in bot.py for the Fuzzy Matcher to handle.
+    to the processing queue in app.py for the Fuzzy Matcher to handle.
     """
     try:
         user_id = await find_owner_by_db_channel(message.chat.id)
@@ -23,7 +52,13 @@ async def new_file_handler(client, message):
             logger.warning("Owner Database Channel not set by admin. Ignoring file.")
             return
         
-        await client.file_queue.put((message, user_id))
+        # Never wait for queue room here: that would hold one of Pyrogram's few update
+        # workers and stall the whole bot. Over-quota files are recorded and queued later.
+        if is_spilling(user_id) or not await client.file_queue.try_put(user_id, message):
+            await spill_file(client, user_id, message)
+            await _send_queue_notice(client, user_id)
+            logger.info(f"Queue full for user {user_id}; file '{media.file_name}' recorded in overflow.")
+            return
         logger.info(f"Added file '{media.file_name}' to the queue for user {user_id}.")
 
     except Exception:
@@ -3,20 +3,26 @@
 import asyncio
 import base64
 import logging
-from pyrogram import Client, filters, enums
+from bson import ObjectId
+from pyrogram import Client, filters
 from pyrogram.enums import ParseMode
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message
 from pyrogram.errors import MessageNotModified
+from config import Config
 from database.db import (
     get_user, update_user, add_to_list, remove_from_list,
-    get_user_file_count, add_footer_button, remove_footer_button,
-    get_all_user_files, get_paginated_files, search_user_files,
+    add_footer_button, remove_footer_button,
+    get_files_page, get_files_by_ids, get_approx_file_count,
     add_user
 )
-from utils.helpers import go_back_button, get_main_menu, create_post, clean_filename, calculate_title_similarity, notify_and_remove_invalid_channel
+from utils.helpers import go_back_button, get_main_menu, notify_and_remove_invalid_channel
+from utils.channel_cache import get_channel_info, invalidate_channel
+from utils.lru_cache import LRUCache
+from features.importer import start_import, cancel_import, ACTIVE_IMPORTS
+from features.backup import start_backup, cancel_backup
+from features.search import search_files
 
 logger = logging.getLogger(__name__)
-ACTIVE_BACKUP_TASKS = set()
 
 
 async def safe_edit_message(source, *args, **kwargs):
@@ -105,10 +111,11 @@ async def get_fsub_menu_parts(client, user_id):
         is_valid = await notify_and_remove_invalid_channel(client, user_id, fsub_ch, "FSub")
         if is_valid:
             try:
-                chat = await client.get_chat(fsub_ch)
-                text += f"Current FSub Channel: **{chat.title}**"
-            except:
-                text += f"Current FSub Channel ID: `{fsub_ch}`"
+                title = (await get_channel_info(client, fsub_ch))['title']
+            except Exception:
+                title = None
+            if title: text += f"Current FSub Channel: **{title}**"
+            else: text += f"Current FSub Channel ID: `{fsub_ch}`"
     else:
         text += "No FSub channel is set."
     return text, InlineKeyboardMarkup([
@@ -145,6 +152,7 @@ async def manage_channels_submenu_handler(client, query):
     buttons = [
         [InlineKeyboardButton("➕ Manage Auto Post", callback_data="manage_post_ch")],
         [InlineKeyboardButton("🗃️ Manage Index DB", callback_data="manage_db_ch")],
+        [InlineKeyboardButton("📥 Import Old Files", callback_data="import_history")],
         [go_back_button(query.from_user.id).inline_keyboard[0][0]]
     ]
     markup = InlineKeyboardMarkup(buttons)
@@ -222,55 +230,98 @@ async def toggle_poster_handler(client, query):
     text, markup = await get_poster_menu_parts(user_id)
     await safe_edit_message(query, text=text, reply_markup=markup)
 
-@Client.on_callback_query(filters.regex(r"my_files_(\d+)"))
+FILES_PER_PAGE = 5
+# Active search per user (query and its ranked result _ids), so page buttons only carry a page number
+SEARCH_SESSIONS = LRUCache(Config.SEARCH_SESSION_LIMIT, Config.SEARCH_SESSION_TTL)
+
+def _encode_cursor(object_id):
+    # 12-byte ObjectId -> 16 URL-safe characters, keeping callback data well under Telegram's 64 bytes
+    return base64.urlsafe_b64encode(object_id.binary).decode()
+
+def _decode_cursor(cursor):
+    return ObjectId(base64.urlsafe_b64decode(cursor))
+
+async def _fetch_page(fetch, direction, cursor):
+    """Runs a keyset page fetch for a nav button. Returns (files, has_prev, has_next)."""
+    if direction == 'p':
+        files_list, has_more = await fetch(after_id=_decode_cursor(cursor))
+        if files_list: return files_list, has_more, True
+        direction = None  # Everything newer is gone; fall back to the first page
+    if direction == 'n':
+        files_list, has_more = await fetch(before_id=_decode_cursor(cursor))
+        return files_list, True, has_more
+    files_list, has_more = await fetch()
+    return files_list, False, has_more
+
+def _page_text(client, files_list):
+    text = ""
+    for file in files_list:
+        # --- BUG FIX: Create a composite ID for the deep link ---
+        composite_id = f"{file['owner_id']}_{file['file_unique_id']}"
+        deep_link = f"https://t.me/{client.me.username}?start=ownerget_{composite_id}"
+        text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
+    return text
+
+def _nav_row(prefix, page, files_list, has_prev, has_next):
+    nav_row = []
+    if not files_list: return nav_row
+    if has_prev and page > 1: nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"{prefix}_p_{page-1}_{_encode_cursor(files_list[0]['_id'])}"))
+    if has_next: nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"{prefix}_n_{page+1}_{_encode_cursor(files_list[-1]['_id'])}"))
+    return nav_row
+
+async def _show_my_files(client, query, direction=None, page=1, cursor=None):
+    user_id = query.from_user.id
+    total_files = await get_approx_file_count(user_id)
+    text = f"**📂 Your Saved Files ({total_files} Total)**\n\n"
+    files_list, has_prev, has_next = await _fetch_page(lambda **kw: get_files_page(user_id, FILES_PER_PAGE, **kw), direction, cursor)
+    if direction == 'p' and not has_prev: page = 1
+    if not files_list: text += "You have not saved any files yet." if page == 1 else "No more files found on this page."
+    else: text += _page_text(client, files_list)
+    buttons = []
+    nav_row = _nav_row("mf", page, files_list, has_prev, has_next)
+    if nav_row: buttons.append(nav_row)
+    buttons.append([InlineKeyboardButton("🔍 Search My Files", callback_data="search_my_files")])
+    buttons.append([InlineKeyboardButton("« Go Back", callback_data=f"go_back_{user_id}")])
+    await safe_edit_message(query, text=text, reply_markup=InlineKeyboardMarkup(buttons), disable_web_page_preview=True)
+
+@Client.on_callback_query(filters.regex(r"^my_files_\d+$"))
 async def my_files_handler(client, query):
     try:
-        user_id = query.from_user.id
-        page = int(query.data.split("_")[-1])
-        total_files = await get_user_file_count(user_id)
-        files_per_page = 5
-        text = f"**📂 Your Saved Files ({total_files} Total)**\n\n"
-        if total_files == 0:
-            text += "You have not saved any files yet."
-        else:
-            files_on_page = await get_paginated_files(user_id, page, files_per_page)
-            if not files_on_page: text += "No more files found on this page."
-            else:
-                for file in files_on_page:
-                    # --- BUG FIX: Create a composite ID for the deep link ---
-                    composite_id = f"{file['owner_id']}_{file['file_unique_id']}"
-                    deep_link = f"https://t.me/{client.me.username}?start=ownerget_{composite_id}"
-                    text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
-        buttons, nav_row = [], []
-        if page > 1: nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"my_files_{page-1}"))
-        if total_files > page * files_per_page: nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"my_files_{page+1}"))
-        if nav_row: buttons.append(nav_row)
-        buttons.append([InlineKeyboardButton("🔍 Search My Files", callback_data="search_my_files")])
-        buttons.append([InlineKeyboardButton("« Go Back", callback_data=f"go_back_{user_id}")])
-        await safe_edit_message(query, text=text, reply_markup=InlineKeyboardMarkup(buttons), disable_web_page_preview=True)
+        await _show_my_files(client, query)
     except Exception:
         logger.exception("Error in my_files_handler"); await query.answer("Something went wrong.", show_alert=True)
 
-async def _format_and_send_search_results(client, query, user_id, search_query, page):
-    files_per_page = 5
-    files_list, total_files = await search_user_files(user_id, search_query, page, files_per_page)
-    text = f"**🔎 Search Results for `{search_query}` ({total_files} Found)**\n\n"
+@Client.on_callback_query(filters.regex(r"^mf_([np])_(\d+)_([\w-]{16})$"))
+async def my_files_page_handler(client, query):
+    try:
+        direction, page, cursor = query.matches[0].groups()
+        await _show_my_files(client, query, direction, int(page), cursor)
+    except Exception:
+        logger.exception("Error in my_files_page_handler"); await query.answer("Something went wrong.", show_alert=True)
+
+async def _format_and_send_search_results(client, query, user_id, page=1):
+    session = SEARCH_SESSIONS.get(user_id)
+    if not session:
+        return await safe_edit_message(query, text="This search has expired. Please search again.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔍 Search My Files", callback_data="search_my_files")]]))
+    search_query, ids = session['query'], session['ids']
+    total = f"{len(ids)}+" if session['capped'] else f"{len(ids)}"
+    # Ranked results are cached per search, so any page is a slice plus one _id lookup
+    files_list = await get_files_by_ids(user_id, ids[(page - 1) * FILES_PER_PAGE:page * FILES_PER_PAGE])
+    text = f"**🔎 Search Results for `{search_query}` ({total} Found)**\n\n"
     if not files_list: text += "No files found for your query."
-    else:
-        for file in files_list:
-            # --- BUG FIX: Create a composite ID for the deep link in search results ---
-            composite_id = f"{file['owner_id']}_{file['file_unique_id']}"
-            deep_link = f"https://t.me/{client.me.username}?start=ownerget_{composite_id}"
-            text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
+    else: text += _page_text(client, files_list)
     buttons, nav_row = [], []
-    encoded_query = base64.urlsafe_b64encode(search_query.encode()).decode().strip("=")
-    if page > 1: nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"search_results_{page-1}_{encoded_query}"))
-    if total_files > page * files_per_page: nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"search_results_{page+1}_{encoded_query}"))
+    if page > 1: nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"sr_{page-1}"))
+    if len(ids) > page * FILES_PER_PAGE: nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"sr_{page+1}"))
     if nav_row: buttons.append(nav_row)
     buttons.append([InlineKeyboardButton("📚 Back to Full List", callback_data="my_files_1")])
     buttons.append([InlineKeyboardButton("« Go Back to Settings", callback_data=f"go_back_{user_id}")])
     await safe_edit_message(query, text=text, reply_markup=InlineKeyboardMarkup(buttons), disable_web_page_preview=True)
 
+async def _start_search(user_id, search_query):
+    ids, capped = await search_files(user_id, search_query)
+    SEARCH_SESSIONS.set(user_id, {'query': search_query, 'ids': ids, 'capped': capped})
+
 @Client.on_callback_query(filters.regex("search_my_files"))
 async def search_my_files_prompt(client, query):
     user_id = query.from_user.id
@@ -278,19 +329,27 @@ async def search_my_files_prompt(client, query):
         prompt = await query.message.edit_text("**🔍 Search Your Files**\n\nPlease send the name of the file you want to find.", reply_markup=go_back_button(user_id))
         response = await client.listen(chat_id=user_id, timeout=300, filters=filters.text)
         await response.delete()
-        await _format_and_send_search_results(client, query, user_id, response.text, 1)
+        await _start_search(user_id, response.text)
+        await _format_and_send_search_results(client, query, user_id)
     except asyncio.TimeoutError: await safe_edit_message(query, text="❗️ **Timeout:** Search cancelled.", reply_markup=go_back_button(user_id))
     except Exception as e:
         logger.exception("Error in search_my_files_prompt"); await safe_edit_message(query, text=f"An error occurred: {e}", reply_markup=go_back_button(user_id))
 
-@Client.on_callback_query(filters.regex(r"search_results_(\d+)_(.+)"))
+@Client.on_callback_query(filters.regex(r"^sr_(\d+)$"))
 async def search_results_paginator(client, query):
     try:
-        page = int(query.matches[0].group(1))
+        await _format_and_send_search_results(client, query, query.from_user.id, int(query.matches[0].group(1)))
+    except Exception:
+        logger.exception("Error during search pagination"); await safe_edit_message(query, text="An error occurred during pagination.")
+
+@Client.on_callback_query(filters.regex(r"^search_results_(\d+)_(.+)"))
+async def legacy_search_results_handler(client, query):
+    """Buttons sent before keyset pagination carry the query itself; restart that search at page 1."""
+    try:
         encoded_query = query.matches[0].group(2)
         padding = 4 - (len(encoded_query) % 4)
-        search_query = base64.urlsafe_b64decode(encoded_query + "=" * padding).decode()
-        await _format_and_send_search_results(client, query, query.from_user.id, search_query, page)
+        await _start_search(query.from_user.id, base64.urlsafe_b64decode(encoded_query + "=" * padding).decode())
+        await _format_and_send_search_results(client, query, query.from_user.id)
     except Exception:
         logger.exception("Error during search pagination"); await safe_edit_message(query, text="An error occurred during pagination.")
 
@@ -302,9 +361,10 @@ async def backup_links_handler(client, query):
     post_channels = user.get('post_channels', [])
     if not post_channels: return await query.answer("You have not set any Post Channels yet.", show_alert=True)
     kb = []
-    for ch_id in post_channels:
-        try: kb.append([InlineKeyboardButton((await client.get_chat(ch_id)).title, callback_data=f"start_backup_{ch_id}")])
-        except: continue
+    infos = await asyncio.gather(*(get_channel_info(client, ch_id) for ch_id in post_channels), return_exceptions=True)
+    for ch_id, info in zip(post_channels, infos):
+        if isinstance(info, Exception) or info['error'] is not None: continue
+        kb.append([InlineKeyboardButton(info['title'], callback_data=f"start_backup_{ch_id}")])
     if not kb: return await query.answer("Could not access any of your Post Channels.", show_alert=True)
     kb.append([InlineKeyboardButton("« Go Back", callback_data=f"go_back_{query.from_user.id}")])
     await safe_edit_message(query, text="**🔄 Smart Backup**\n\nSelect a channel to back up your posts to.", reply_markup=InlineKeyboardMarkup(kb))
@@ -312,64 +372,54 @@ async def backup_links_handler(client, query):
 @Client.on_callback_query(filters.regex(r"start_backup_-?\d+"))
 async def start_backup_process(client, query):
     user_id = query.from_user.id
-    if user_id in ACTIVE_BACKUP_TASKS: return await query.answer("A backup process is already running.", show_alert=True)
     channel_id = int(query.data.split("_")[-1])
-    ACTIVE_BACKUP_TASKS.add(user_id)
-    try:
-        await query.message.edit_text("⏳ `Step 1/3:` Fetching all your file records...")
-        all_file_docs = await (await get_all_user_files(user_id)).to_list(length=None)
-        if not all_file_docs:
-            return await safe_edit_message(query, text="You have no files to back up.", reply_markup=go_back_button(user_id))
-        await query.message.edit_text("⏳ `Step 2/3:` Intelligently grouping files by similarity...")
-        batches = []
-        for doc in all_file_docs:
-            if not doc.get('file_name'): continue
-            doc_title, _, _ = clean_filename(doc['file_name'])
-            if not doc_title: continue
-            added_to_existing_batch = False
-            for batch in batches:
-                batch_title, _, _ = clean_filename(batch[0]['file_name'])
-                if calculate_title_similarity(doc_title, batch_title) > 0.85:
-                    batch.append(doc)
-                    added_to_existing_batch = True
-                    break
-            if not added_to_existing_batch:
-                batches.append([doc])
-        total_batches = len(batches)
-        await safe_edit_message(query, text=f"✅ `Step 2/3:` Found **{total_batches}** unique posts to create. Starting backup...", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
-        for i, file_docs_batch in enumerate(batches):
-            if user_id not in ACTIVE_BACKUP_TASKS:
-                await safe_edit_message(query, text="❌ Backup cancelled by user.", reply_markup=go_back_button(user_id)); return
-            try:
-                message_ids = [int(d['raw_link'].split('/')[-1]) for d in file_docs_batch]
-                source_chat_id = int("-100" + file_docs_batch[0]['raw_link'].split('/')[-2])
-                file_messages = await client.get_messages(source_chat_id, message_ids)
-                posts_to_send = await create_post(client, user_id, file_messages)
-                for post in posts_to_send:
-                    poster, caption, footer = post
-                    if poster: await client.send_photo(channel_id, photo=poster, caption=caption, reply_markup=footer)
-                    else: await client.send_message(channel_id, caption, reply_markup=footer, disable_web_page_preview=True)
-                    await asyncio.sleep(3)
-                progress_text = f"🔄 `Step 3/3:` Progress: {i + 1} / {total_batches} batches processed."
-                await safe_edit_message(query, text=progress_text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
-            except Exception as e:
-                logger.exception(f"Failed to post batch during backup for user {user_id}.")
-                await client.send_message(user_id, f"Failed to back up a batch. Error: {e}")
-        await query.message.delete()
-        await client.send_message(user_id, "✅ **Backup Complete!**", reply_markup=go_back_button(user_id))
-    except Exception as e:
-        logger.exception("Major error in backup process"); await safe_edit_message(query, text=f"A major error occurred: {e}", reply_markup=go_back_button(user_id))
-    finally:
-        ACTIVE_BACKUP_TASKS.discard(user_id)
+    resumed_from = await start_backup(client, user_id, channel_id, query.message.id)
+    if resumed_from is None: return await query.answer("A backup process is already running.", show_alert=True)
+    text = f"♻️ Resuming your previous backup from batch **{resumed_from + 1}**..." if resumed_from else "⏳ Starting backup..."
+    await safe_edit_message(query, text=text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
 
 @Client.on_callback_query(filters.regex(r"cancel_backup_"))
 async def cancel_backup_handler(client, query):
     user_id = int(query.data.split("_")[-1])
     if query.from_user.id != user_id: return await query.answer("This is not for you.", show_alert=True)
-    if user_id in ACTIVE_BACKUP_TASKS:
-        ACTIVE_BACKUP_TASKS.discard(user_id); await query.answer("Cancellation signal sent.", show_alert=True)
+    if cancel_backup(user_id): await query.answer("Cancellation signal sent.", show_alert=True)
     else: await query.answer("No active backup process found.", show_alert=True)
 
+@Client.on_callback_query(filters.regex("^import_history$"))
+async def import_history_handler(client, query):
+    user_id = query.from_user.id
+    if user_id in ACTIVE_IMPORTS: return await query.answer("An import is already running. Check the progress message.", show_alert=True)
+    user = await get_user(user_id)
+    db_channels = user.get('db_channels', []) if user else []
+    if not db_channels: return await query.answer("You have not set a Database Channel yet.", show_alert=True)
+    if not client.owner_db_channel_id: return await query.answer("The bot is not yet configured by the admin.", show_alert=True)
+    try:
+        prompt = await query.message.edit_text(
+            "**📥 Import Old Files**\n\n"
+            "I will go through your Database Channel history and save and post every file that is not saved yet.\n\n"
+            "Please forward the **latest** message from your Database Channel so I know where to stop.",
+            reply_markup=go_back_button(user_id)
+        )
+        response = await client.listen(chat_id=user_id, filters=filters.forwarded, timeout=300)
+        if not response.forward_from_chat or response.forward_from_chat.id not in db_channels or not response.forward_from_message_id:
+            await response.reply_text("Please forward a message from your own Database Channel.", reply_markup=go_back_button(user_id))
+        elif await start_import(client, user_id, response.forward_from_chat.id, response.forward_from_message_id):
+            await response.reply_text("✅ Import started. I will keep you updated on the progress.", reply_markup=go_back_button(user_id))
+        else:
+            await response.reply_text("An import is already running.", reply_markup=go_back_button(user_id))
+        await prompt.delete()
+    except asyncio.TimeoutError:
+        await safe_edit_message(query, text="❗️ **Timeout:** Import cancelled.", reply_markup=go_back_button(user_id))
+    except Exception as e:
+        logger.exception("Error in import_history_handler"); await safe_edit_message(query, text=f"An error occurred: {e}", reply_markup=go_back_button(user_id))
+
+@Client.on_callback_query(filters.regex(r"cancel_import_"))
+async def cancel_import_handler(client, query):
+    user_id = int(query.data.split("_")[-1])
+    if query.from_user.id != user_id: return await query.answer("This is not for you.", show_alert=True)
+    if cancel_import(user_id): await query.answer("Cancellation signal sent.", show_alert=True)
+    else: await query.answer("No active import found.", show_alert=True)
+
 @Client.on_callback_query(filters.regex("manage_footer"))
 async def manage_footer_handler(client, query):
     user = await get_user(query.from_user.id)
@@ -426,17 +476,16 @@ async def manage_channels_handler(client, query):
     if channels:
         await query.answer("Checking channel status...")
         text += "Here are your connected channels. Click to remove.\n\n"
-        for ch_id in channels:
-            try:
-                chat = await client.get_chat(ch_id)
-                member = await client.get_chat_member(ch_id, "me")
-                if member.status not in [enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER]:
-                    buttons.append([InlineKeyboardButton(f"⚠️ Admin rights needed in {chat.title}", callback_data=f"rm_{ch_type}_{ch_id}")])
-                else:
-                    buttons.append([InlineKeyboardButton(f"✅ {chat.title}", callback_data=f"rm_{ch_type}_{ch_id}")])
-            except Exception as e:
-                logger.warning(f"Could not access channel {ch_id} for user {user_id}. Error: {e}")
+        infos = await asyncio.gather(*(get_channel_info(client, ch_id) for ch_id in channels), return_exceptions=True)
+        for ch_id, info in zip(channels, infos):
+            error = info if isinstance(info, Exception) else info['error']
+            if error is not None:
+                logger.warning(f"Could not access channel {ch_id} for user {user_id}. Error: {error}")
                 buttons.append([InlineKeyboardButton(f"👻 Ghost Channel - Click to Remove", callback_data=f"rm_{ch_type}_{ch_id}")])
+            elif not info['is_admin']:
+                buttons.append([InlineKeyboardButton(f"⚠️ Admin rights needed in {info['title']}", callback_data=f"rm_{ch_type}_{ch_id}")])
+            else:
+                buttons.append([InlineKeyboardButton(f"✅ {info['title']}", callback_data=f"rm_{ch_type}_{ch_id}")])
     else:
         text += "You haven't added any channels yet."
         
@@ -484,6 +533,7 @@ async def add_channel_prompt(client, query):
         
         if response.forward_from_chat:
             await add_to_list(user_id, ch_type_key, response.forward_from_chat.id)
+            invalidate_channel(response.forward_from_chat.id)
             await response.reply_text(f"✅ Connected to **{response.forward_from_chat.title}**.", reply_markup=go_back_button(user_id))
         else: 
             await response.reply_text("This is not a valid forwarded message from a channel.", reply_markup=go_back_button(user_id))
@@ -6,7 +6,7 @@ from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from config import Config
 from database.db import add_user, get_file_by_unique_id, get_user, get_owner_db_channel, is_user_verified, update_user, claim_verification_for_file
 from utils.helpers import get_main_menu
-from features.shortener import get_shortlink
+from features.shortener import get_shortlink, delivery_link
 
 logger = logging.getLogger(__name__)
 
@@ -195,8 +195,7 @@ async def handle_public_file_request(client, message, requester_id, payload):
     shortener_mode = owner_settings.get('shortener_mode', 'each_time')
     
     # --- BUG FIX: Create final link with the composite ID ---
-    composite_id = f"{owner_id}_{file_unique_id}"
-    final_delivery_link = f"https://t.me/{client.me.username}?start=finalget_{composite_id}"
+    final_delivery_link = delivery_link(client.me.username, owner_id, file_unique_id)
     text = ""
     buttons = []
 
@@ -206,7 +205,7 @@ async def handle_public_file_request(client, message, requester_id, payload):
     else:
         if shortener_mode == 'each_time':
             text = "**Your file is almost ready!**\n\n1. Click the button above.\n2. You will be redirected back, and I will send you the file."
-            shortened_link = await get_shortlink(final_delivery_link, owner_id)
+            shortened_link = await get_shortlink(final_delivery_link, owner_id, owner_settings)
             buttons.append([InlineKeyboardButton("➡️ Click Here to Get Your File ⬅️", url=shortened_link)])
         elif shortener_mode == '12_hour':
             if await is_user_verified(requester_id, owner_id):
@@ -214,7 +213,7 @@ async def handle_public_file_request(client, message, requester_id, payload):
                 buttons.append([InlineKeyboardButton("➡️ Get Your File Directly ⬅️", url=final_delivery_link)])
             else:
                 text = "**One-Time Verification Required**\n\nTo get direct access for 12 hours, please complete this one-time verification step."
-                shortened_link = await get_shortlink(final_delivery_link, owner_id)
+                shortened_link = await get_shortlink(final_delivery_link, owner_id, owner_settings)
                 buttons.append([InlineKeyboardButton("➡️ Click to Verify (12 Hours) ⬅️", url=shortened_link)])
 
     if owner_settings.get("how_to_download_link"):
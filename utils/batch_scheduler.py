@@ -0,0 +1,140 @@
+# batch_scheduler.py
+
+import time
+import heapq
+import asyncio
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) a due batch held for the owner's queued files checks again
+BACKLOG_RECHECK = 0.5
+
+
+class BatchScheduler:
+    """
+    Keeps every open batch in one place and closes them from a single timer task.
+
+    Each batch has one entry in a deadline heap. When more files arrive the batch's
+    deadline is simply moved; the heap entry is re-armed lazily when it fires, so
+    adding a file never cancels or creates timers.
+
+    Debounce is adaptive:
+    - a batch with a single file closes after BATCH_SINGLE_DELAY,
+    - while files keep arriving the wait follows their average gap
+      (BATCH_GAP_FACTOR x gap, clamped to BATCH_MIN_DELAY..BATCH_MAX_DELAY),
+    - no batch stays open longer than BATCH_MAX_AGE.
+
+    Gaps and deadlines are measured on the files' arrival (enqueue) times, not on when
+    the worker gets to them. A due batch is held while `backlog(user_id)` reports a file
+    of that owner that arrived before the deadline and is still unprocessed, so queueing
+    behind other owners never splits a forwarded pack.
+    """
+
+    def __init__(self, on_close, backlog=None):
+        self.on_close = on_close
+        self.backlog = backlog
+        self.batches = {}
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = set()
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+
+    def add(self, user_id, batch_key, item, arrived_at=None):
+        """
+        Adds an item to the (user_id, batch_key) batch. arrived_at is the time.monotonic()
+        at which the file was queued (default: now). Returns True if a new batch was opened.
+        """
+        now = time.monotonic() if arrived_at is None else arrived_at
+        key = (user_id, batch_key)
+        batch = self.batches.get(key)
+        is_new = batch is None
+
+        if is_new:
+            batch = {'items': [item], 'created_at': now, 'last_added': now, 'gap': None, 'deadline': now + Config.BATCH_SINGLE_DELAY, 'scheduled': None}
+            self.batches[key] = batch
+        else:
+            gap = now - batch['last_added']
+            batch['gap'] = gap if batch['gap'] is None else 0.7 * batch['gap'] + 0.3 * gap
+            batch['last_added'] = now
+            batch['items'].append(item)
+            delay = min(max(batch['gap'] * Config.BATCH_GAP_FACTOR, Config.BATCH_MIN_DELAY), Config.BATCH_MAX_DELAY)
+            batch['deadline'] = min(now + delay, batch['created_at'] + Config.BATCH_MAX_AGE)
+
+        # Only push when the batch has no entry yet or needs to fire earlier than its entry
+        if batch['scheduled'] is None or batch['deadline'] < batch['scheduled']:
+            self._arm(key, batch)
+        return is_new
+
+    def get(self, user_id, batch_key):
+        return self.batches.get((user_id, batch_key))
+
+    def snapshot(self):
+        """Returns the state of all open batches, soonest to close first."""
+        now = time.monotonic()
+        state = [{
+            'user_id': user_id,
+            'batch_key': batch_key,
+            'files': len(batch['items']),
+            'age': now - batch['created_at'],
+            'closes_in': max(0.0, batch['deadline'] - now)
+        } for (user_id, batch_key), batch in self.batches.items()]
+        return sorted(state, key=lambda b: b['closes_in'])
+
+    def _arm(self, key, batch):
+        batch['scheduled'] = batch['deadline']
+        heapq.heappush(self._heap, (batch['deadline'], key))
+        if self._heap[0][1] == key:
+            self._wakeup.set()
+
+    def _close_due(self):
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            scheduled, key = heapq.heappop(self._heap)
+            batch = self.batches.get(key)
+            if not batch or batch['scheduled'] != scheduled:
+                continue  # Stale entry, superseded by an earlier one
+            if batch['deadline'] > now:
+                self._arm(key, batch)
+                continue
+            if self._held(key[0], batch, now):
+                batch['scheduled'] = now + BACKLOG_RECHECK
+                heapq.heappush(self._heap, (batch['scheduled'], key))
+                continue
+            del self.batches[key]
+            task = asyncio.create_task(self.on_close(key[0], key[1], batch['items']))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def _held(self, user_id, batch, now):
+        """True if a file the owner sent before the deadline is still waiting to be processed."""
+        if not self.backlog or now >= batch['created_at'] + Config.BATCH_MAX_AGE: return False
+        oldest = self.backlog(user_id)
+        return oldest is not None and oldest <= batch['deadline']
+
+    async def _run(self):
+        logger.info("Batch Scheduler started.")
+        while True:
+            try:
+                self._wakeup.clear()
+                self._close_due()
+                timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                try: await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError: pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Error in batch scheduler: {e}")
+                await asyncio.sleep(1)
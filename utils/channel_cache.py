@@ -0,0 +1,52 @@
+# channel_cache.py
+
+import time
+import logging
+from pyrogram import enums
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+# How long a successful check is trusted, and how long a failed one is remembered
+CHANNEL_CACHE_TTL = 30 * 60
+CHANNEL_NEGATIVE_TTL = 5 * 60
+
+_channel_cache = {}
+
+
+async def get_channel_info(client, channel_id, force=False):
+    """
+    Returns cached accessibility info for a channel:
+    {'title', 'is_admin', 'error', 'verified_at'}.
+    'error' holds the exception raised by Telegram when the channel is inaccessible.
+    FloodWait is never cached and is raised to the caller.
+    """
+    entry = _channel_cache.get(channel_id)
+    now = time.monotonic()
+    if entry and not force:
+        ttl = CHANNEL_CACHE_TTL if entry['error'] is None else CHANNEL_NEGATIVE_TTL
+        if now - entry['verified_at'] < ttl:
+            return entry
+
+    try:
+        chat = await client.get_chat(channel_id)
+        member = await client.get_chat_member(channel_id, "me")
+        entry = {
+            'title': chat.title,
+            'is_admin': member.status in (enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER),
+            'error': None,
+            'verified_at': now
+        }
+    except FloodWait:
+        raise
+    except Exception as e:
+        entry = {'title': None, 'is_admin': False, 'error': e, 'verified_at': now}
+
+    _channel_cache[channel_id] = entry
+    return entry
+
+
+def invalidate_channel(channel_id):
+    """Drops the cached info for a channel so the next lookup hits Telegram again."""
+    if _channel_cache.pop(channel_id, None):
+        logger.info(f"Channel cache invalidated for {channel_id}.")
@@ -0,0 +1,88 @@
+# circuit_breaker.py
+# Per-domain health tracking for third-party APIs, with a circuit breaker and call statistics.
+
+import time
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+# Weight of the newest sample in the latency moving average
+LATENCY_ALPHA = 0.2
+
+_breakers = {}
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `cooldown`
+    seconds. After that it lets a single probe through (half-open): success closes it
+    again, failure re-opens it for another cooldown.
+    """
+
+    def __init__(self, name, failure_threshold, cooldown):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.stats = {'calls': 0, 'successes': 0, 'failures': 0, 'api_errors': 0, 'rejected': 0,
+                      'avg_latency': 0.0, 'max_latency': 0.0, 'last_error': None, 'last_error_at': None}
+
+    def allow(self):
+        """True if a call may go ahead now. Rejected calls are counted."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state, self.probe_in_flight = HALF_OPEN, False
+        if self.state == CLOSED: return True
+        if self.state == HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.stats['rejected'] += 1
+        return False
+
+    def abandon(self):
+        """The call was cancelled before it finished; free the half-open probe slot."""
+        self.probe_in_flight = False
+
+    def _record(self, latency):
+        stats = self.stats
+        stats['calls'] += 1
+        stats['avg_latency'] = latency if stats['calls'] == 1 else (1 - LATENCY_ALPHA) * stats['avg_latency'] + LATENCY_ALPHA * latency
+        stats['max_latency'] = max(stats['max_latency'], latency)
+
+    def record_success(self, latency):
+        self._record(latency)
+        self.stats['successes'] += 1
+        if self.state != CLOSED: logger.info(f"Circuit for {self.name} closed again.")
+        self.state, self.consecutive_failures, self.probe_in_flight = CLOSED, 0, False
+
+    def record_api_error(self, latency, error):
+        """The service answered but refused the request (e.g. a bad API key): it is healthy, the caller is not."""
+        self._record(latency)
+        self.stats['api_errors'] += 1
+        self.stats['last_error'], self.stats['last_error_at'] = str(error), time.time()
+        self.state, self.consecutive_failures, self.probe_in_flight = CLOSED, 0, False
+
+    def record_failure(self, latency, error):
+        self._record(latency)
+        self.stats['failures'] += 1
+        self.stats['last_error'], self.stats['last_error_at'] = str(error) or type(error).__name__, time.time()
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN: logger.warning(f"Circuit for {self.name} opened after {self.consecutive_failures} consecutive failures.")
+            self.state, self.opened_at = OPEN, time.monotonic()
+
+
+def get_breaker(domain):
+    breaker = _breakers.get(domain)
+    if breaker is None:
+        breaker = _breakers[domain] = CircuitBreaker(domain, Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_COOLDOWN)
+    return breaker
+
+
+def get_all_breakers():
+    return dict(_breakers)
@@ -0,0 +1,59 @@
+# cpu_pool.py
+
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_workers = 0
+
+
+def _warm_up():
+    # Importing the parsers once per worker keeps the first real job fast
+    import PTN, rapidfuzz, thefuzz  # noqa: F401
+    import utils.filename_parser, utils.grouping  # noqa: F401
+    return os.getpid()
+
+
+async def start_cpu_pool(workers=0):
+    """Starts the process pool (one worker per core by default) and warms every worker."""
+    global _executor, _workers
+    if _executor: return
+    _workers = workers = workers or _workers or os.cpu_count() or 1
+    # 'spawn' starts clean interpreters instead of forking the running bot. Each worker
+    # re-imports the entry script (bot.py, kept light for this) and then only the
+    # modules of the jobs it runs, such as utils.filename_parser and utils.grouping.
+    _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    loop = asyncio.get_running_loop()
+    pids = await asyncio.gather(*(loop.run_in_executor(_executor, _warm_up) for _ in range(workers)))
+    logger.info(f"CPU pool started with {len(set(pids))} worker processes.")
+
+
+async def stop_cpu_pool():
+    global _executor
+    if _executor:
+        executor, _executor = _executor, None
+        await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+        logger.info("CPU pool stopped.")
+
+
+async def run_cpu(func, *args):
+    """
+    Runs a picklable, module-level function in the process pool.
+    Falls back to a worker thread if the pool is not running or has broken.
+    """
+    global _executor
+    if _executor:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+        except BrokenProcessPool:
+            logger.error("CPU pool is broken; restarting it and running this job in a thread.")
+            broken, _executor = _executor, None
+            if broken: broken.shutdown(wait=False)
+            asyncio.create_task(start_cpu_pool())
+    return await asyncio.to_thread(func, *args)
@@ -0,0 +1,134 @@
+# filename_parser.py
+# Pure filename parsing, kept free of pyrogram/database imports so it can run in worker processes.
+
+import re
+import logging
+import PTN
+from typing import Any, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FileMeta(NamedTuple):
+    """Everything we derive from a filename, computed once per file."""
+    title: str
+    full_title: str
+    year: Optional[str] = None
+    season: Any = None
+    episode: Any = None
+    resolution: Optional[str] = None
+    quality: Optional[str] = None
+    audio: Optional[str] = None
+    codec: Optional[str] = None
+    group: Optional[str] = None
+
+
+def _parse_title(name: str):
+    """
+    The definitive 'champion pro' filename cleaner.
+    Returns (base_title, full_title, year, season, episode).
+    """
+    if not name:
+        return "Untitled", "Untitled", None, None, None
+
+    try:
+        processed_name = name.replace('.', ' ').replace('_', ' ')
+        
+        parsed_info = PTN.parse(processed_name)
+        base_title = parsed_info.get('title')
+        year = str(parsed_info.get('year')) if parsed_info.get('year') else None
+
+        if not base_title:
+            raise ValueError("PTN did not find a title, triggering fallback.")
+
+        if 'season' in parsed_info and 'episode' in parsed_info:
+            season = parsed_info.get('season')
+            episode = parsed_info.get('episode')
+            full_title = f"{base_title} S{str(season).zfill(2)}E{str(episode).zfill(2)}"
+            episode_name = parsed_info.get('episodeName')
+            if episode_name:
+                full_title = f"{full_title} - {episode_name}"
+            return base_title.strip(), full_title.strip(), year, season, episode
+
+        return base_title.strip(), base_title.strip(), year, parsed_info.get('season'), parsed_info.get('episode')
+
+    except Exception:
+        logger.warning(f"PTN failed for '{name}'. Using the robust regex fallback.")
+        
+        fallback_name = re.sub(r'\.[^.]*$', '', name)
+        fallback_name = fallback_name.replace('.', ' ').replace('_', ' ').strip()
+        fallback_name = re.sub(r'\s*\(\d{4}\)\s*', '', fallback_name).strip()
+        fallback_name = re.sub(r'\s*\[.*?\]\s*', '', fallback_name).strip()
+
+        match = re.split(r'\b(19|20)\d{2}\b|720p|1080p|4k|webrip|web-dl|bluray|hdrip', fallback_name, maxsplit=1, flags=re.I)
+        final_title = match[0].strip()
+        
+        if not final_title:
+            final_title = fallback_name
+
+        return final_title, final_title, None, None, None
+
+
+def parse_filename_uncached(name: str) -> FileMeta:
+    title, full_title, year, season, episode = _parse_title(name)
+    # Quality tags come from the raw name; PTN recognises codecs like 'H.264' only with the dots intact
+    try: tags = PTN.parse(name) if name else {}
+    except Exception: tags = {}
+    return FileMeta(title, full_title, year, season, episode,
+                    tags.get('resolution'), tags.get('quality'), tags.get('audio'), tags.get('codec'), tags.get('group'))
+
+
+def title_key(title: str) -> str:
+    """Normalized title that files are batched under, stored on every file as 'title_key'."""
+    key = re.sub(r'@\S+', '', title or '')
+    key = re.sub(r'Join Us On Telegram', '', key, flags=re.IGNORECASE)
+    return key.lower().strip()
+
+
+def clean_post_title(title: str) -> str:
+    """Title with channel mentions and spam tags removed, as shown in posts."""
+    cleaned = re.sub(r'@\S+', '', title or '').strip()
+    return re.sub(r'Join Us On Telegram', '', cleaned, flags=re.IGNORECASE).strip()
+
+
+# Longer words are indexed (and searched) by their first SEARCH_TOKEN_MAX characters
+SEARCH_TOKEN_MAX = 15
+
+
+def search_words(text: str) -> list:
+    """Words of a title or search query after the same cleaning posts use, lower-cased, punctuation dropped."""
+    return re.sub(r'[^\w\s]', ' ', clean_post_title(text).lower()).split()
+
+
+def _as_ints(value):
+    values = value if isinstance(value, list) else [value]
+    return [v for v in values if isinstance(v, int)]
+
+
+def episode_tokens(meta: FileMeta) -> set:
+    """Season/episode tags of a file, such as 's01', 'e05' and 's01e05'."""
+    seasons, episodes = _as_ints(meta.season), _as_ints(meta.episode)
+    tokens = {f"s{s:02d}" for s in seasons} | {f"e{e:02d}" for e in episodes}
+    tokens.update(f"s{s:02d}e{e:02d}" for s in seasons for e in episodes)
+    return tokens
+
+
+def search_tokens(meta: FileMeta) -> list:
+    """
+    Tokens a file is indexed under for search: every prefix (2+ characters) of each title
+    word, the year, the resolution and season/episode tags such as 's01', 'e05' and 's01e05'.
+    """
+    tokens = set()
+    for word in search_words(meta.title):
+        word = word[:SEARCH_TOKEN_MAX]
+        tokens.add(word)
+        tokens.update(word[:n] for n in range(2, len(word)))
+    if meta.year: tokens.add(str(meta.year))
+    if meta.resolution: tokens.add(str(meta.resolution).lower())
+    tokens.update(episode_tokens(meta))
+    return sorted(tokens)
+
+
+def parse_many(names):
+    """Parses a list of filenames; the unit of work sent to the CPU pool."""
+    return [parse_filename_uncached(name) for name in names]
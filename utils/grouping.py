@@ -0,0 +1,51 @@
+# grouping.py
+
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+from thefuzz import fuzz as thefuzz
+
+# thefuzz rounds token_sort_ratio to an int and we keep matches scoring above 85,
+# which is the same as an unrounded score of at least 85.5
+SIMILARITY_CUTOFF = 85.5
+
+
+def title_block_key(title: str) -> str:
+    """
+    Normalised key used to block titles before fuzzy matching: lower-cased, punctuation
+    stripped and tokens sorted. Two titles with the same key always score 100 under
+    token_sort_ratio, and scoring keys with plain ratio() equals token_sort_ratio on the titles.
+    """
+    return " ".join(sorted(default_process(title or "").split()))
+
+
+def group_titles(titles, cutoff=SIMILARITY_CUTOFF):
+    """
+    Groups titles the way Smart Backup always has: each title joins the first existing
+    group whose first title is similar enough, otherwise it starts a new group.
+
+    Titles are first blocked by title_block_key, so each distinct key is scored once
+    instead of once per file. Each key is then scored against all group leaders in one
+    batched rapidfuzz call. Returns lists of indices into `titles`, in group creation order.
+    """
+    blocks = {}
+    for i, title in enumerate(titles):
+        blocks.setdefault(title_block_key(title), []).append(i)
+
+    leader_keys, groups = [], []
+    for key, members in blocks.items():
+        matches = process.extract(key, leader_keys, scorer=fuzz.ratio, score_cutoff=cutoff, limit=None) if leader_keys else []
+        if matches:
+            groups[min(index for _, _, index in matches)].extend(members)
+        else:
+            leader_keys.append(key)
+            groups.append(list(members))
+
+    # Blocks are merged out of file order; restore it inside every group
+    for group in groups:
+        group.sort()
+    return groups
+
+
+def score_titles(query, titles):
+    """Similarity (0..1, thefuzz token_sort_ratio) of `query` against every title."""
+    return [thefuzz.token_sort_ratio(query, title) / 100.0 for title in titles]
@@ -3,12 +3,16 @@
 import re
 import base64
 import logging
-import PTN
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from pyrogram.errors import UserNotParticipant, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate
+from pyrogram.errors import UserNotParticipant, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate, FloodWait
 from config import Config
-from database.db import get_user, remove_from_list
-from features.poster import get_poster
+from database.db import get_user, remove_from_list, get_files_to_backfill, set_file_fields
+from features.poster import get_poster, prefetch_poster
+from utils.channel_cache import get_channel_info
+from utils import tracing, cpu_pool
+from utils.lru_cache import LRUCache
+from utils.filename_parser import FileMeta, parse_filename_uncached, parse_many, title_key, clean_post_title, search_tokens
+from utils.grouping import score_titles
 from thefuzz import fuzz
 
 logger = logging.getLogger(__name__)
@@ -17,158 +21,211 @@ logger = logging.getLogger(__name__)
 PHOTO_CAPTION_LIMIT = 1024
 TEXT_MESSAGE_LIMIT = 4096
 
-def clean_filename(name: str):
+# Batches smaller than this are cheaper to score inline than to ship to the CPU pool
+CPU_POOL_MIN_BATCH = 32
+
+# Parsed filenames kept in memory; bulk forwards repeat the same names over and over
+FILE_META_CACHE_SIZE = 4096
+_file_meta_cache = LRUCache(FILE_META_CACHE_SIZE)
+
+
+def parse_filename(name: str) -> FileMeta:
+    """Returns the FileMeta for a filename, served from an in-process LRU cache when possible."""
+    meta = _file_meta_cache.get(name)
+    if meta is None:
+        meta = parse_filename_uncached(name)
+        _file_meta_cache.set(name, meta)
+    return meta
+
+
+async def parse_filenames(names) -> list:
     """
-    The definitive 'champion pro' filename cleaner.
+    Async, batched parse_filename. Cache misses are parsed together in the CPU pool
+    so bulk work never runs PTN on the event loop.
     """
-    if not name:
-        return "Untitled", "Untitled", None
+    misses = list(dict.fromkeys(name for name in names if name not in _file_meta_cache))
+    parsed = dict(zip(misses, await cpu_pool.run_cpu(parse_many, misses))) if misses else {}
+    for name, meta in parsed.items():
+        _file_meta_cache.set(name, meta)
+    return [parsed.get(name) or parse_filename(name) for name in names]
 
-    try:
-        processed_name = name.replace('.', ' ').replace('_', ' ')
-        
-        parsed_info = PTN.parse(processed_name)
-        base_title = parsed_info.get('title')
-        year = str(parsed_info.get('year')) if parsed_info.get('year') else None
 
-        if not base_title:
-            raise ValueError("PTN did not find a title, triggering fallback.")
+async def parse_filename_async(name: str) -> FileMeta:
+    return (await parse_filenames([name]))[0]
 
-        if 'season' in parsed_info and 'episode' in parsed_info:
-            season = parsed_info.get('season')
-            episode = parsed_info.get('episode')
-            full_title = f"{base_title} S{str(season).zfill(2)}E{str(episode).zfill(2)}"
-            episode_name = parsed_info.get('episodeName')
-            if episode_name:
-                full_title = f"{full_title} - {episode_name}"
-            return base_title.strip(), full_title.strip(), year
 
-        return base_title.strip(), base_title.strip(), year
+def get_file_meta(doc) -> FileMeta:
+    """FileMeta of a 'files' document, using the copy stored alongside it when present."""
+    stored = doc.get('meta')
+    if stored:
+        try: return FileMeta(**stored)
+        except TypeError: pass  # Stored by an older version with different fields
+    return parse_filename(doc.get('file_name'))
 
-    except Exception:
-        logger.warning(f"PTN failed for '{name}'. Using the robust regex fallback.")
-        
-        fallback_name = re.sub(r'\.[^.]*$', '', name)
-        fallback_name = fallback_name.replace('.', ' ').replace('_', ' ').strip()
-        fallback_name = re.sub(r'\s*\(\d{4})\s*', '', fallback_name).strip()
-        fallback_name = re.sub(r'\s*\[.*?\]\s*', '', fallback_name).strip()
 
-        match = re.split(r'\b(19|20)\d{2}\b|720p|1080p|4k|webrip|web-dl|bluray|hdrip', fallback_name, maxsplit=1, flags=re.I)
-        final_title = match[0].strip()
-        
-        if not final_title:
-            final_title = fallback_name
+def clean_filename(name: str):
+    """Returns (base_title, full_title, year) for a filename."""
+    meta = parse_filename(name)
+    return meta.title, meta.full_title, meta.year
 
-        return final_title, final_title, None
+class BatchFile:
+    """
+    Compact per-file record kept in open batches instead of the full pyrogram Message,
+    so a batch does not keep chat, user and client object graphs alive until it is posted.
+    """
+    __slots__ = ('file_unique_id', 'file_name', 'file_size', 'message_id', 'meta')
+
+    def __init__(self, file_unique_id, file_name, file_size, message_id, meta=None):
+        self.file_unique_id = file_unique_id
+        self.file_name = file_name
+        self.file_size = file_size
+        self.message_id = message_id
+        self.meta = meta or parse_filename(file_name)
+
+    @property
+    def title(self): return self.meta.title
+    @property
+    def full_title(self): return self.meta.full_title
+    @property
+    def year(self): return self.meta.year
+
+    @classmethod
+    def from_message(cls, message, meta=None):
+        media = getattr(message, message.media.value, None)
+        if not media: return None
+        return cls(media.file_unique_id, media.file_name, media.file_size, message.id, meta)
+
+    @classmethod
+    def from_doc(cls, doc):
+        """Builds a record from a 'files' collection document."""
+        return cls(doc['file_unique_id'], doc.get('file_name'), doc.get('file_size'), doc.get('file_id'), get_file_meta(doc))
+
+async def prefetch_post_poster(user_id, f):
+    """
+    Starts the poster lookup that create_post() will need for a batch opened by BatchFile `f`.
+    Skipped for owners without posters or without post channels, whose batches are never posted.
+    """
+    try:
+        user = await get_user(user_id)
+        if user and user.get('show_poster', True) and user.get('post_channels'): prefetch_poster(clean_post_title(f.title), f.year)
+    except Exception as e:
+        logger.warning(f"Could not prefetch poster for '{f.title}': {e}")
 
 # ================================================================= #
 # VVVVVV SMART POST SPLITTING: Ab yeh function bade batches ko multiple posts mein split karega VVVVVV #
 # ================================================================= #
-async def create_post(client, user_id, messages):
+async def create_post(client, user_id, files):
     """
-    Creates professionally designed posts. If the content for one post is too long,
-    it automatically splits it into multiple, well-formed posts.
+    Creates professionally designed posts from a batch of BatchFile records. If the content
+    for one post is too long, it automatically splits it into multiple, well-formed posts.
     """
     user = await get_user(user_id)
-    if not user: return []
-    first_media_obj = getattr(messages[0], messages[0].media.value, None)
-    if not first_media_obj: return []
+    if not user or not files: return []
 
-    primary_base_title, _, year = clean_filename(first_media_obj.file_name)
+    primary_base_title, year = files[0].title, files[0].year
     
-    cleaned_primary_title = re.sub(r'@\S+', '', primary_base_title).strip()
-    cleaned_primary_title = re.sub(r'Join Us On Telegram', '', cleaned_primary_title, flags=re.IGNORECASE).strip()
-
-    def similarity_sorter(msg):
-        media_obj = getattr(msg, msg.media.value, None)
-        if not media_obj: return (1.0, "")
-        base, _, _ = clean_filename(media_obj.file_name)
-        similarity_score = 1.0 - calculate_title_similarity(cleaned_primary_title, base)
-        natural_key = natural_sort_key(media_obj.file_name)
-        return (similarity_score, natural_key)
-    messages.sort(key=similarity_sorter)
+    cleaned_primary_title = clean_post_title(primary_base_title)
+
+    titles = [f.title for f in files]
+    if len(files) >= CPU_POOL_MIN_BATCH: scores = await cpu_pool.run_cpu(score_titles, cleaned_primary_title, titles)
+    else: scores = score_titles(cleaned_primary_title, titles)
+    order = sorted(range(len(files)), key=lambda i: (1.0 - scores[i], natural_sort_key(files[i].file_name)))
+    files[:] = [files[i] for i in order]
     
     base_caption_header = f"🎬 **{cleaned_primary_title} {f'({year})' if year else ''}**"
     
-    post_poster = await get_poster(cleaned_primary_title, year) if user.get('show_poster', True) else None
+    post_poster = None
+    if user.get('show_poster', True):
+        with tracing.span('get_poster'):
+            post_poster = await get_poster(cleaned_primary_title, year)
     
     footer_buttons = user.get('footer_buttons', [])
     footer_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(btn['name'], url=btn['url'])] for btn in footer_buttons]) if footer_buttons else None
     
-    header_line = "▰▱▰▱▰▱▰▱▰▱▰▱▰▱▰▱"
-    footer_line = "\n\n" + "•·•·•·•·•·•·•·•·•·••·•·•·•·•·•·•·•"
-
     # Decide the character limit based on whether a poster is present
-    CAPTION_LIMIT = PHOTO_CAPTION_LIMIT if post_poster else TEXT_MESSAGE_LIMIT
-    
-    # Generate all file link entries first
-    all_link_entries = []
-    for m in messages:
-        media = getattr(m, m.media.value, None)
-        if not media: continue
-        
-        _, full_cleaned_label, _ = clean_filename(media.file_name)
-        label_no_mentions = re.sub(r'@\S+', '', full_cleaned_label).strip()
-        label_no_mentions = re.sub(r'Join Us On Telegram', '', label_no_mentions, flags=re.IGNORECASE).strip()
+    caption_limit = PHOTO_CAPTION_LIMIT if post_poster else TEXT_MESSAGE_LIMIT
+    entries = [format_file_entry(user_id, f) for f in files]
+    return [(post_poster, caption, footer_keyboard) for caption in split_captions(base_caption_header, entries, caption_limit)]
 
-        parsed_info = PTN.parse(media.file_name)
-        extra_tags = [parsed_info.get(tag) for tag in ['resolution', 'quality', 'audio', 'codec', 'group']]
-        filtered_text = " | ".join(tag for tag in extra_tags if tag)
+POST_HEADER_LINE = "▰▱▰▱▰▱▰▱▰▱▰▱▰▱▰▱"
+POST_FOOTER_LINE = "\n\n" + "•·•·•·•·•·•·•·•·•·••·•·•·•·•·•·•·•"
 
-        composite_id = f"{user_id}_{media.file_unique_id}"
-        link = f"http://{Config.VPS_IP}:{Config.VPS_PORT}/get/{composite_id}"
-        
-        file_entry = f"📁 `{label_no_mentions or media.file_name}`"
-        if filtered_text:
-            file_entry += f"\n    `{filtered_text}`"
-        file_entry += f"\n    [➤ Click Here]({link})"
-        all_link_entries.append(file_entry)
-
-    # Now, build posts, splitting them intelligently
-    final_posts = []
+def format_file_entry(user_id, f) -> str:
+    """The caption entry for one file: its label, quality tags and download link."""
+    label_no_mentions = clean_post_title(f.full_title)
+
+    extra_tags = [f.meta.resolution, f.meta.quality, f.meta.audio, f.meta.codec, f.meta.group]
+    filtered_text = " | ".join(tag for tag in extra_tags if tag)
+
+    composite_id = f"{user_id}_{f.file_unique_id}"
+    link = f"http://{Config.VPS_IP}:{Config.VPS_PORT}/get/{composite_id}"
+
+    file_entry = f"📁 `{label_no_mentions or f.file_name}`"
+    if filtered_text:
+        file_entry += f"\n    `{filtered_text}`"
+    file_entry += f"\n    [➤ Click Here]({link})"
+    return file_entry
+
+def split_captions(caption_header: str, entries, limit: int) -> list:
+    """
+    Packs file entries under the header into as few captions as fit within `limit`
+    characters. When more than one caption is needed, headers are numbered (Part X/Y).
+    """
+    captions = []
     current_links_part = []
-    current_length = 0
 
     # Start with base length (header + footer)
-    base_caption = f"{header_line}\n{base_caption_header}\n{header_line}"
-    current_length = len(base_caption) + len(footer_line)
+    base_caption = f"{POST_HEADER_LINE}\n{caption_header}\n{POST_HEADER_LINE}"
+    base_length = len(base_caption) + len(POST_FOOTER_LINE)
+    current_length = base_length
 
-    for entry in all_link_entries:
+    for entry in entries:
         entry_length = len(entry) + 2 # +2 for the double newline
-        
-        if current_length + entry_length > CAPTION_LIMIT:
+
+        if current_length + entry_length > limit:
             # Finalize the current post because it's full
             if current_links_part:
-                caption = base_caption + "\n\n" + "\n\n".join(current_links_part) + footer_line
-                final_posts.append((post_poster, caption, footer_keyboard))
-            
+                captions.append(base_caption + "\n\n" + "\n\n".join(current_links_part) + POST_FOOTER_LINE)
+
             # Start a new post
             current_links_part = [entry]
-            current_length = len(base_caption) + len(footer_line) + entry_length
+            current_length = base_length + entry_length
         else:
             # Add to the current post
             current_links_part.append(entry)
             current_length += entry_length
-            
+
     # Add the last remaining post
     if current_links_part:
-        caption = base_caption + "\n\n" + "\n\n".join(current_links_part) + footer_line
-        final_posts.append((post_poster, caption, footer_keyboard))
-        
+        captions.append(base_caption + "\n\n" + "\n\n".join(current_links_part) + POST_FOOTER_LINE)
+
     # If there are multiple parts, add (Part X/Y) to the headers
-    total_posts = len(final_posts)
+    total_posts = len(captions)
     if total_posts > 1:
-        for i, (poster, caption, footer) in enumerate(final_posts):
-            new_header = f"{base_caption_header} (Part {i+1}/{total_posts})"
-            final_posts[i] = (poster, caption.replace(base_caption_header, new_header), footer)
+        for i, caption in enumerate(captions):
+            new_header = f"{caption_header} (Part {i+1}/{total_posts})"
+            captions[i] = caption.replace(caption_header, new_header)
 
-    return final_posts
+    return captions
 
 def get_title_key(filename: str) -> str:
-    base_title, _, _ = clean_filename(filename)
-    cleaned_base_title = re.sub(r'@\S+', '', base_title)
-    cleaned_base_title = re.sub(r'Join Us On Telegram', '', cleaned_base_title, flags=re.IGNORECASE)
-    return cleaned_base_title.lower().strip()
+    return title_key(parse_filename(filename).title)
+
+async def backfill_file_fields(owner_id=None, chunk_size=1000):
+    """Stores meta, title_key, year and search_tokens on files saved before they were recorded. Returns the count."""
+    done = 0
+    while True:
+        docs = await get_files_to_backfill(owner_id, chunk_size)
+        if not docs: return done
+        metas = await parse_filenames([doc.get('file_name') for doc in docs])
+        await set_file_fields([
+            (doc['_id'], {
+                'meta': meta._asdict(), 'title_key': title_key(meta.title) if doc.get('file_name') else '',
+                'year': meta.year, 'search_tokens': search_tokens(meta) if doc.get('file_name') else []
+            })
+            for doc, meta in zip(docs, metas)
+        ])
+        done += len(docs)
 
 async def get_main_menu(user_id):
     user_settings = await get_user(user_id)
@@ -216,9 +273,14 @@ async def notify_and_remove_invalid_channel(client, user_id, channel_id, channel
     """
     db_key = f"{channel_type.lower()}_channels"
     try:
-        await client.get_chat_member(channel_id, "me")
+        e = (await get_channel_info(client, channel_id))['error']
+    except FloodWait as flood:
+        logger.warning(f"FloodWait of {flood.value}s while checking channel {channel_id}. Assuming it is still valid.")
+        return True
+
+    if e is None:
         return True
-    except (UserNotParticipant, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate) as e:
+    if isinstance(e, (UserNotParticipant, ChatAdminRequired, ChannelInvalid, PeerIdInvalid, ChannelPrivate)):
         logger.warning(f"Channel {channel_id} is inaccessible due to '{type(e).__name__}'. Removing from DB for user {user_id}.")
         
         error_text = (
@@ -233,7 +295,7 @@ async def notify_and_remove_invalid_channel(client, user_id, channel_id, channel
         except Exception as notify_error:
             logger.error(f"Failed to notify or remove channel for user {user_id}. Error: {notify_error}")
         return False
-    except Exception as e:
+    else:
         logger.error(f"An unexpected error occurred while checking channel {channel_id}: {e}. Assuming invalid and removing.")
         
         error_text = (
@@ -251,6 +313,32 @@ async def notify_and_remove_invalid_channel(client, user_id, channel_id, channel
 def calculate_title_similarity(title1: str, title2: str) -> float:
     return fuzz.token_sort_ratio(title1, title2) / 100.0
 
+# Telegram returns at most this many messages per get_messages call
+GET_MESSAGES_LIMIT = 200
+
+def cancel_markup(job_type, owner_id):
+    """A single '❌ Cancel <Job>' button, answered by the cancel_<job_type>_<owner_id> callback."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(f"❌ Cancel {job_type.title()}", callback_data=f"cancel_{job_type}_{owner_id}")]])
+
+async def update_job_status(client, owner_id, job, text, markup, save_job):
+    """
+    Shows a background job's progress in its status message: edits it in place, or sends
+    a new one when there is none or it can no longer be edited, and stores the new
+    message id with save_job(owner_id, fields).
+    """
+    try:
+        if job.get('status_message_id'):
+            await client.edit_message_text(owner_id, job['status_message_id'], text, reply_markup=markup)
+            return
+    except Exception:
+        pass
+    try:
+        sent = await client.send_message(owner_id, text, reply_markup=markup)
+        job['status_message_id'] = sent.id
+        await save_job(owner_id, {'status_message_id': sent.id})
+    except Exception as e:
+        logger.warning(f"Could not send job status to user {owner_id}: {e}")
+
 def go_back_button(user_id):
     return InlineKeyboardMarkup([[InlineKeyboardButton("« Go Back", callback_data=f"go_back_{user_id}")]])
 
@@ -0,0 +1,87 @@
+# http_client.py
+# One pooled aiohttp session for all outbound HTTP (poster sources, URL shorteners).
+
+import asyncio
+import logging
+import aiohttp
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the first retry; doubled on every further attempt
+RETRY_BACKOFF = 0.5
+DNS_CACHE_TTL = 300
+
+_session = None
+
+
+class HTTPStatusError(Exception):
+    """A non-retryable error status (4xx other than 429), raised by request(raise_for_status=True)."""
+
+    def __init__(self, status, reason=None):
+        super().__init__(f"HTTP {status} {reason or ''}".strip())
+        self.status = status
+
+
+def _create_session():
+    connector = aiohttp.TCPConnector(
+        limit=Config.HTTP_POOL_SIZE,
+        limit_per_host=Config.HTTP_PER_HOST_LIMIT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        enable_cleanup_closed=True
+    )
+    timeout = aiohttp.ClientTimeout(total=Config.HTTP_TIMEOUT, connect=min(5, Config.HTTP_TIMEOUT))
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def start_http_client():
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+        logger.info("HTTP client started.")
+
+
+async def stop_http_client():
+    global _session
+    if _session and not _session.closed:
+        session, _session = _session, None
+        await session.close()
+        logger.info("HTTP client stopped.")
+
+
+def get_session():
+    """The shared session, created on first use if start_http_client() has not run."""
+    global _session
+    if _session is None or _session.closed: _session = _create_session()
+    return _session
+
+
+async def request(method, url, *, as_json=False, retries=None, raise_for_status=False, **kwargs):
+    """
+    Sends a request through the shared session and returns the body of a 2xx response
+    (parsed JSON if as_json). Any other status gives None, or HTTPStatusError with
+    raise_for_status. Connection errors, timeouts, 429 and 5xx responses are retried
+    with exponential backoff; the last error is raised.
+    """
+    retries = Config.HTTP_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            async with get_session().request(method, url, **kwargs) as resp:
+                if resp.status == 429 or resp.status >= 500:
+                    raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status, message=resp.reason)
+                if not 200 <= resp.status < 300:
+                    if raise_for_status: raise HTTPStatusError(resp.status, resp.reason)
+                    return None
+                return await resp.json(content_type=None) if as_json else await resp.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt >= retries: raise
+            logger.debug(f"{method} {url} failed ({e!r}); retry {attempt + 1}/{retries}.")
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+async def get_text(url, **kwargs):
+    return await request('GET', url, **kwargs)
+
+
+async def get_json(url, **kwargs):
+    return await request('GET', url, as_json=True, **kwargs)
@@ -0,0 +1,146 @@
+# ingest_queue.py
+
+import time
+import asyncio
+from collections import deque
+
+
+class _Lane:
+    """Per-owner FIFOs served round-robin."""
+
+    def __init__(self):
+        self.queues = {}
+        self.owners = deque()
+        self.size = 0
+
+    def pending(self, owner_id):
+        return len(self.queues.get(owner_id, ()))
+
+    def push(self, owner_id, item):
+        if owner_id not in self.queues:
+            self.queues[owner_id] = deque()
+            self.owners.append(owner_id)
+        self.queues[owner_id].append((item, time.monotonic()))
+        self.size += 1
+
+    def pop(self):
+        owner_id = self.owners.popleft()
+        queue = self.queues[owner_id]
+        item, enqueued_at = queue.popleft()
+        if queue: self.owners.append(owner_id)
+        else: del self.queues[owner_id]
+        self.size -= 1
+        return item, owner_id, time.monotonic() - enqueued_at
+
+
+class IngestQueue:
+    """
+    Bounded ingestion queue with a per-owner quota and round-robin dequeuing.
+
+    Every owner has their own FIFO. get() serves owners in turn, one file each, so a
+    single owner forwarding thousands of files cannot push everyone else to the back.
+    put() waits while the owner is over quota or the whole queue is full, so only
+    background producers may await it; update handlers use try_put(), which never waits.
+
+    Bulk work (history imports) goes to a separate, separately bounded lane that is
+    only served when no live file is waiting, so it can never starve live ingestion.
+    """
+
+    def __init__(self, maxsize, owner_quota, bulk_size):
+        self.maxsize = maxsize
+        self.owner_quota = owner_quota
+        self.bulk_size = bulk_size
+        self._live = _Lane()
+        self._bulk = _Lane()
+        self._cond = asyncio.Condition()
+        self._unfinished = {}
+        self._in_service = {}
+        self._idle = {}
+        self._last_done = None
+        self._avg_service_time = None
+
+    def qsize(self):
+        return self._live.size + self._bulk.size
+
+    def pending(self, owner_id):
+        return self._live.pending(owner_id)
+
+    def oldest_pending(self, owner_id):
+        """time.monotonic() at which this owner's oldest unprocessed file was queued, or None."""
+        times = [lane.queues[owner_id][0][1] for lane in (self._live, self._bulk) if owner_id in lane.queues]
+        times += self._in_service.get(owner_id, ())
+        return min(times) if times else None
+
+    def is_full_for(self, owner_id):
+        return self._live.size >= self.maxsize or self._live.pending(owner_id) >= self.owner_quota
+
+    def position(self, owner_id):
+        """Roughly how many live files will be processed before this owner's last queued file."""
+        mine = self._live.pending(owner_id)
+        return mine + sum(min(len(q), mine) for o, q in self._live.queues.items() if o != owner_id)
+
+    def eta(self, owner_id, extra=0):
+        """
+        Estimated seconds until this owner's queue drains, plus `extra` files still waiting
+        outside it, or None before any file was processed.
+        """
+        if self._avg_service_time is None: return None
+        return (self.position(owner_id) + extra) * self._avg_service_time
+
+    def _push(self, lane, owner_id, item):
+        lane.push(owner_id, item)
+        self._unfinished[owner_id] = self._unfinished.get(owner_id, 0) + 1
+        self._idle.setdefault(owner_id, asyncio.Event()).clear()
+        self._cond.notify_all()
+
+    async def put(self, owner_id, item, bulk=False):
+        async with self._cond:
+            if bulk:
+                await self._cond.wait_for(lambda: self._bulk.size < self.bulk_size)
+                self._push(self._bulk, owner_id, item)
+            else:
+                await self._cond.wait_for(lambda: not self.is_full_for(owner_id))
+                self._push(self._live, owner_id, item)
+
+    async def try_put(self, owner_id, item):
+        """Queues a live file if the owner is under quota and the queue has room. Returns False instead of waiting."""
+        async with self._cond:
+            if self.is_full_for(owner_id): return False
+            self._push(self._live, owner_id, item)
+            return True
+
+    async def get(self):
+        """Returns (item, owner_id, seconds waited in queue) from the next owner in turn, live files first."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.qsize() > 0)
+            item, owner_id, waited = entry = self._live.pop() if self._live.size else self._bulk.pop()
+            self._in_service.setdefault(owner_id, []).append(time.monotonic() - waited)
+            self._cond.notify_all()
+            return entry
+
+    def task_done(self, owner_id):
+        """Marks a file of this owner as processed; also feeds the per-file service time estimate."""
+        now = time.monotonic()
+        if self._last_done is not None:
+            elapsed = now - self._last_done
+            self._avg_service_time = elapsed if self._avg_service_time is None else 0.9 * self._avg_service_time + 0.1 * elapsed
+        # Idle time between an empty queue and the next file must not count as service time
+        self._last_done = now if self.qsize() else None
+
+        in_service = self._in_service.get(owner_id)
+        if in_service:
+            in_service.pop(0)
+            if not in_service: del self._in_service[owner_id]
+
+        remaining = self._unfinished.get(owner_id, 0) - 1
+        if remaining > 0:
+            self._unfinished[owner_id] = remaining
+        else:
+            self._unfinished.pop(owner_id, None)
+            idle = self._idle.pop(owner_id, None)
+            if idle: idle.set()
+
+    async def join(self, owner_id):
+        """Waits until every file queued for this owner has been processed."""
+        idle = self._idle.get(owner_id)
+        if idle: await idle.wait()
@@ -0,0 +1,49 @@
+# lru_cache.py
+# Small in-process LRU cache with optional per-entry expiry, used by all of the bot's memory caches.
+
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Holds at most `maxsize` entries and evicts the least recently used one first. An entry
+    expires `ttl` seconds after it was set (the ttl given to set(), else the cache's own;
+    None never expires), and an expired entry counts as missing. Cached values may be None:
+    pass a `default` to get() to tell a cached None from a miss.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expiry as time.monotonic() or None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None: return default
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (value, None if ttl is None else time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize: self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,52 @@
+# photo_cache.py
+# Poster URL -> Telegram photo file_id, so each poster is fetched by Telegram only once.
+
+import asyncio
+import logging
+from database import db
+from utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+PHOTO_CACHE_SIZE = 2048
+
+_file_ids = LRUCache(PHOTO_CACHE_SIZE)
+_upload_locks = {}
+
+
+async def get_photo_file_id(url):
+    """The file_id recorded for a poster URL, from memory or Mongo, or None."""
+    file_id = _file_ids.get(url)
+    if file_id: return file_id
+    try:
+        file_id = await db.get_photo_file_id(url)
+    except Exception as e:
+        logger.warning(f"Photo file_id lookup failed for {url}: {e}"); return None
+    if file_id: _file_ids.set(url, file_id)
+    return file_id
+
+
+async def remember_photo_file_id(url, file_id):
+    _file_ids.set(url, file_id)
+    try:
+        await db.save_photo_file_id(url, file_id)
+    except Exception as e:
+        logger.warning(f"Could not store photo file_id for {url}: {e}")
+
+
+async def forget_photo_file_id(url):
+    _file_ids.pop(url, None)
+    try:
+        await db.delete_photo_file_id(url)
+    except Exception as e:
+        logger.warning(f"Could not delete photo file_id for {url}: {e}")
+
+
+def upload_lock(url):
+    """Lock held while a poster URL is uploaded, so concurrent senders wait and reuse the result."""
+    return _upload_locks.setdefault(url, asyncio.Lock())
+
+
+def release_upload_lock(url):
+    """Drops a URL's upload lock once its upload has finished or failed, so the table stays small."""
+    _upload_locks.pop(url, None)
@@ -0,0 +1,151 @@
+# tracing.py
+
+import time
+import logging
+import contextvars
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+MAX_OPEN_TIMELINES = 500
+MAX_RECENT_TIMELINES = 100
+
+_histograms = {}
+_open_timelines = OrderedDict()
+_recent_timelines = deque(maxlen=MAX_RECENT_TIMELINES)
+_current = contextvars.ContextVar('trace_target', default=None)
+
+
+class _Target:
+    __slots__ = ('owner_id', 'batch_key', 'pending', 'closing')
+
+    def __init__(self, owner_id, batch_key=None, closing=False):
+        self.owner_id = owner_id
+        self.batch_key = batch_key
+        self.pending = []
+        self.closing = closing
+
+
+def _timeline(owner_id, batch_key):
+    key = (owner_id, batch_key)
+    timeline = _open_timelines.get(key)
+    if timeline is None:
+        timeline = {'owner_id': owner_id, 'batch_key': batch_key, 'opened_at': time.time(), 'closed_at': None, 'stages': {}}
+        _open_timelines[key] = timeline
+        if len(_open_timelines) > MAX_OPEN_TIMELINES: _open_timelines.popitem(last=False)
+    return timeline
+
+
+def _add_to_timeline(timeline, stage, started, duration):
+    # Per stage: [count, total, max, first start offset, last end offset]
+    offset = started - timeline['opened_at']
+    agg = timeline['stages'].get(stage)
+    if agg is None:
+        timeline['stages'][stage] = [1, duration, duration, offset, offset + duration]
+    else:
+        agg[0] += 1; agg[1] += duration; agg[2] = max(agg[2], duration)
+        agg[3] = min(agg[3], offset); agg[4] = max(agg[4], offset + duration)
+
+
+def record(stage, duration, started=None):
+    """Records one measurement for a stage, attributing it to the current file or batch if any."""
+    hist = _histograms.get(stage)
+    if hist is None:
+        hist = _histograms[stage] = {'buckets': [0] * (len(BUCKETS) + 1), 'count': 0, 'sum': 0.0, 'max': 0.0}
+    hist['buckets'][bisect_left(BUCKETS, duration)] += 1
+    hist['count'] += 1
+    hist['sum'] += duration
+    hist['max'] = max(hist['max'], duration)
+
+    target = _current.get()
+    if target is None: return
+    started = started if started is not None else time.time() - duration
+    if target.batch_key is None or target.closing:
+        target.pending.append((stage, started, duration))
+    else:
+        _add_to_timeline(_timeline(target.owner_id, target.batch_key), stage, started, duration)
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as one occurrence of `stage`."""
+    started, start = time.time(), time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, started)
+
+
+@contextmanager
+def trace_file(owner_id):
+    """Scope for processing one file. Its spans are held until bind_batch() names the batch."""
+    token = _current.set(_Target(owner_id))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def bind_batch(batch_key):
+    """Attaches the current file's spans to the timeline of the batch it joined."""
+    target = _current.get()
+    if target is None: return
+    target.batch_key = batch_key
+    timeline = _timeline(target.owner_id, batch_key)
+    for stage, started, duration in target.pending:
+        _add_to_timeline(timeline, stage, started, duration)
+    target.pending.clear()
+
+
+@contextmanager
+def trace_batch(owner_id, batch_key):
+    """Scope for finalizing a batch. Records the debounce wait and closes the timeline on exit."""
+    timeline = _timeline(owner_id, batch_key)
+    # Detach it right away so files opening a new batch with the same key start a fresh timeline
+    del _open_timelines[(owner_id, batch_key)]
+    waited = max(0.0, time.time() - timeline['opened_at'])
+    record('batch_wait', waited, timeline['opened_at'])
+    _add_to_timeline(timeline, 'batch_wait', timeline['opened_at'], waited)
+
+    target = _Target(owner_id, batch_key, closing=True)
+    token = _current.set(target)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        for stage, started, duration in target.pending:
+            _add_to_timeline(timeline, stage, started, duration)
+        timeline['closed_at'] = time.time()
+        _recent_timelines.append(timeline)
+
+
+def _quantile(hist, q):
+    rank = q * hist['count']
+    seen = 0
+    for i, n in enumerate(hist['buckets']):
+        seen += n
+        if seen >= rank:
+            return BUCKETS[i] if i < len(BUCKETS) else hist['max']
+    return hist['max']
+
+
+def get_histograms():
+    """Per-stage summary: count, average, p50/p95 (bucket upper bounds) and max, in seconds."""
+    return {stage: {
+        'count': h['count'],
+        'avg': h['sum'] / h['count'],
+        'p50': _quantile(h, 0.50),
+        'p95': _quantile(h, 0.95),
+        'max': h['max'],
+        'buckets': list(zip(BUCKETS + (float('inf'),), h['buckets']))
+    } for stage, h in _histograms.items() if h['count']}
+
+
+def get_timelines(owner_id=None, limit=5):
+    """Returns the most recent finished batch timelines, newest first."""
+    result = [t for t in reversed(_recent_timelines) if owner_id is None or t['owner_id'] == owner_id]
+    return result[:limit]